@@ -0,0 +1,79 @@
+"""Benchmark of permessage-deflate: bytes received on the wire and CPU time spent.
+
+Receives the same messages from a local websocket server with compression disabled and
+enabled, and reports the bytes read off the socket and the process CPU time of each.
+
+Usage::
+
+    python benchmarks/compression.py
+"""
+import json
+import os
+import sys
+import time
+from functools import partial
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import trio  # noqa: E402
+from wsproto import ConnectionType, WSConnection  # noqa: E402
+from wsproto.events import AcceptConnection, CloseConnection, Request, TextMessage  # noqa: E402
+from wsproto.extensions import PerMessageDeflate  # noqa: E402
+from blocknative.connection import open_websocket, Compression, TransportStats  # noqa: E402
+from payloads import UNISWAP_MESSAGE  # noqa: E402
+
+MESSAGE_COUNT = 2000
+SETTINGS = {
+    "plain": None,
+    "deflate": Compression(window_bits=12, memory_level=4),
+}
+
+
+async def _deflate_server(messages, stream):
+    """Minimal websocket server which accepts permessage-deflate when it is offered."""
+    ws = WSConnection(ConnectionType.SERVER)
+    while True:
+        data = await stream.receive_some()
+        if not data:
+            return
+        ws.receive_data(data)
+        for event in ws.events():
+            if isinstance(event, Request):
+                await stream.send_all(
+                    ws.send(AcceptConnection(extensions=[PerMessageDeflate()]))
+                )
+                for message in messages:
+                    await stream.send_all(ws.send(TextMessage(data=message)))
+            elif isinstance(event, CloseConnection):
+                await stream.send_all(ws.send(event.response()))
+                return
+
+
+async def _receive_all(compression: Compression) -> dict:
+    """Receives ``MESSAGE_COUNT`` messages, returning the bytes and CPU time it took."""
+    stats = TransportStats()
+    messages = [json.dumps(UNISWAP_MESSAGE)] * MESSAGE_COUNT
+    async with trio.open_nursery() as nursery:
+        listeners = await nursery.start(
+            trio.serve_tcp, partial(_deflate_server, messages), 0
+        )
+        port = listeners[0].socket.getsockname()[1]
+        start = time.process_time()
+        async with open_websocket(f"ws://127.0.0.1:{port}", compression, stats) as ws:
+            for _ in range(MESSAGE_COUNT):
+                await ws.get_message()
+        cpu = time.process_time() - start
+        nursery.cancel_scope.cancel()
+    return {"bytes_received": stats.bytes_received, "cpu_ms": cpu * 1000}
+
+
+def main():
+    print(f"{'settings':<24}{'bytes received':>16}{'cpu ms':>10}")
+    for name, compression in SETTINGS.items():
+        result = trio.run(_receive_all, compression)
+        print(f"{name:<24}{result['bytes_received']:>16}{result['cpu_ms']:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,378 @@
+"""Microbenchmarks of the per-message hot path.
+
+Times each function in isolation on recorded payloads and reports the time per call, the
+peak memory allocated by a single call and the number of memory blocks each call leaves
+allocated. Times are also expressed relative to a calibration loop run in the same process,
+which factors out the speed of the machine and interpreter. Results are compared against
+``baseline.json`` on these relative times; the script exits with a non-zero status if any
+benchmark is slower than its baseline by more than the tolerance, or leaves more blocks
+allocated per call than it did.
+
+Usage::
+
+    python benchmarks/hot_path.py                 # compare against the baseline
+    python benchmarks/hot_path.py --save          # record a new baseline
+    python benchmarks/hot_path.py -k flatten      # run matching benchmarks only
+
+Relative times still vary somewhat between CPUs and Python versions; raise the tolerance
+when comparing against a baseline recorded elsewhere.
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import trio  # noqa: E402
+from blocknative.abi import abi_store  # noqa: E402
+from blocknative.exceptions import SDKError  # noqa: E402
+from blocknative.stream import Config, Stream  # noqa: E402
+from blocknative.utils import raise_error_on_status, subscription_type  # noqa: E402
+from payloads import (  # noqa: E402
+    ABI,
+    LARGE_MESSAGE,
+    LARGE_RAW,
+    RATE_LIMIT_MESSAGE,
+    UNISWAP_MESSAGE,
+    UNISWAP_RAW,
+)
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+TOLERANCE = 0.25
+REPEATS = 5
+MIN_DURATION = 0.2  # seconds per repeat
+BLOCK_LOOPS = 1000  # calls over which the blocks left allocated are averaged
+BLOCK_TOLERANCE = 0.5  # allowed increase of the blocks left allocated per call
+
+
+async def _noop_callback(*args):
+    pass
+
+
+def _stream() -> Stream:
+    stream = Stream("benchmark-key")
+    stream.subscribe_address(
+        UNISWAP_MESSAGE["event"]["transaction"]["watchedAddress"], _noop_callback
+    )
+    return stream
+
+
+class _EndOfMessages(Exception):
+    pass
+
+
+class _ReplayWebSocket:
+    """Websocket which delivers ``message`` on every other read, and ends the loop reading
+    it in between, so that each call of ``_poll_messages`` handles the message once."""
+
+    def __init__(self, message: str):
+        self.message = message
+        self.delivered = False
+
+    async def get_message(self) -> str:
+        self.delivered = not self.delivered
+        if not self.delivered:
+            raise _EndOfMessages()
+        return self.message
+
+
+def _poll(message: str):
+    """Returns a coroutine function which reads and handles ``message`` from a websocket."""
+    stream = _stream()
+    stream._ws = _ReplayWebSocket(message)
+
+    async def poll():
+        try:
+            await stream._poll_messages()
+        except _EndOfMessages:
+            pass
+
+    return poll
+
+
+def _raise_rate_limit():
+    try:
+        raise_error_on_status(RATE_LIMIT_MESSAGE)
+    except SDKError:
+        pass
+
+
+def _calibration():
+    """Reference workload of dict, string and list operations, representative of the hot
+    path but independent of the SDK, so its time only depends on the machine."""
+    transaction = {"hash": "0x00", "status": "pending", "value": "1000", "gas": 21000}
+    return [f"{key}:{value}" for key, value in transaction.items() if value]
+
+
+def _sync_cases():
+    """Benchmarks of plain functions, as (name, zero-argument callable)."""
+    stream = _stream()
+    flatten = stream._flatten_event_to_transaction
+    config = Config(
+        "0x7a250d5630b4cf539739df2c5dacb4c659f2488d", [{"status": "pending"}], ABI
+    )
+    data = config.as_dict()
+    abi = abi_store.intern(ABI)
+
+    def send_config_message():
+        stream._send_config_message(config.scope, True, config.filters, abi)
+        stream._message_queue.get_nowait()
+
+    def send_message():
+        stream.send_message(data)
+        stream._message_queue.get_nowait()
+
+    return [
+        ("flatten_event", lambda: flatten(UNISWAP_MESSAGE["event"])),
+        ("flatten_event_large", lambda: flatten(LARGE_MESSAGE["event"])),
+        ("decode_message", lambda: json.loads(UNISWAP_RAW)),
+        ("decode_message_large", lambda: json.loads(LARGE_RAW)),
+        ("raise_error_on_status_ok", lambda: raise_error_on_status(UNISWAP_MESSAGE)),
+        ("raise_error_on_status_ratelimit", _raise_rate_limit),
+        ("subscription_type", lambda: subscription_type(UNISWAP_MESSAGE)),
+        ("build_payload", lambda: stream._build_payload("configs", "put", data)),
+        ("config_as_dict", config.as_dict),
+        ("send_config_message_abi", send_config_message),
+        ("send_message", send_message),
+    ]
+
+
+def _async_cases():
+    """Benchmarks of coroutine functions, as (name, zero-argument coroutine function)."""
+    stream = _stream()
+    return [
+        ("message_handler", lambda: stream._message_handler(UNISWAP_MESSAGE)),
+        ("message_handler_large", lambda: stream._message_handler(LARGE_MESSAGE)),
+        ("poll_messages", _poll(UNISWAP_RAW)),
+        ("poll_messages_large", _poll(LARGE_RAW)),
+    ]
+
+
+@contextlib.contextmanager
+def _cross_thread_cases():
+    """Benchmarks of calls made from another thread into a running stream, as (name,
+    zero-argument callable). The stream's event loop runs in a background thread while the
+    benchmarks run."""
+    stream = _stream()
+    started = threading.Event()
+    cancel_scope = trio.CancelScope()
+
+    async def loop():
+        stream._attach_loop()
+        with cancel_scope:
+            started.set()
+            await trio.sleep_forever()
+
+    thread = threading.Thread(target=trio.run, args=(loop,))
+    thread.start()
+    started.wait()
+    try:
+        # Round trip from submitting an operation until it has been applied in the loop
+        yield [("control_submit_applied", lambda: stream.control.submit([id]).result())]
+    finally:
+        stream._trio_token.run_sync_soon(cancel_scope.cancel)
+        thread.join()
+
+
+def _time_loop(func, loops: int) -> float:
+    start = time.perf_counter_ns()
+    for _ in range(loops):
+        func()
+    return time.perf_counter_ns() - start
+
+
+def _time_async_loop(func, loops: int) -> float:
+    async def run():
+        start = time.perf_counter_ns()
+        for _ in range(loops):
+            await func()
+        return time.perf_counter_ns() - start
+
+    return trio.run(run)
+
+
+def _alloc(func) -> int:
+    """Returns the peak number of bytes allocated by one warm call of ``func``."""
+    func()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        func()
+        return tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+
+
+def _alloc_async(func) -> int:
+    """Returns the peak number of bytes allocated by one warm call of coroutine ``func``."""
+
+    async def run():
+        await func()
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            await func()
+            return tracemalloc.get_traced_memory()[1] - before
+        finally:
+            tracemalloc.stop()
+
+    return trio.run(run)
+
+
+def _blocks(func) -> float:
+    """Returns the number of memory blocks left allocated per warm call of ``func``."""
+    func()
+    gc.disable()
+    try:
+        before = sys.getallocatedblocks()
+        for _ in range(BLOCK_LOOPS):
+            func()
+        return (sys.getallocatedblocks() - before) / BLOCK_LOOPS
+    finally:
+        gc.enable()
+
+
+def _blocks_async(func) -> float:
+    """Returns the number of memory blocks left allocated per warm call of coroutine ``func``."""
+
+    async def run():
+        await func()
+        gc.disable()
+        try:
+            before = sys.getallocatedblocks()
+            for _ in range(BLOCK_LOOPS):
+                await func()
+            return (sys.getallocatedblocks() - before) / BLOCK_LOOPS
+        finally:
+            gc.enable()
+
+    return trio.run(run)
+
+
+def _loops(timer, func) -> int:
+    """Returns the number of calls that take at least a tenth of ``MIN_DURATION``."""
+    loops = 1
+    while timer(func, loops) < MIN_DURATION * 1e9 / 10:
+        loops *= 10
+    return loops
+
+
+def _measure(timer, alloc, blocks, func, calibration_loops: int) -> dict:
+    """Returns the time per call, relative to the calibration loop too, and its allocations.
+
+    Each repeat times the calibration loop right before the function, so that both are
+    measured under the same load and CPU frequency. The relative time is the median of the
+    ratios of the repeats.
+    """
+    loops = _loops(timer, func)
+    times = []
+    ratios = []
+    for _ in range(REPEATS):
+        calibration = _time_loop(_calibration, calibration_loops) / calibration_loops
+        times.append(timer(func, loops) / loops)
+        ratios.append(times[-1] / calibration)
+    return {
+        "ns_per_op": round(min(times), 1),
+        "relative": round(statistics.median(ratios), 3),
+        "alloc_bytes_per_op": alloc(func),
+        "blocks_per_op": round(blocks(func), 2),
+    }
+
+
+def run(pattern: str = None) -> dict:
+    """Runs the benchmarks whose name contains ``pattern``."""
+    with _cross_thread_cases() as cross_thread_cases:
+        cases = [
+            (name, _time_loop, _alloc, _blocks, func)
+            for name, func in _sync_cases() + cross_thread_cases
+        ]
+        cases += [
+            (name, _time_async_loop, _alloc_async, _blocks_async, func)
+            for name, func in _async_cases()
+        ]
+        calibration_loops = _loops(_time_loop, _calibration)
+        return {
+            name: _measure(timer, alloc, blocks, func, calibration_loops)
+            for name, timer, alloc, blocks, func in cases
+            if pattern is None or pattern in name
+        }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Returns the names of the benchmarks whose time relative to the calibration loop
+    regressed beyond ``tolerance``, or which leave more blocks allocated per call."""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name, {})
+        if "relative" not in reference:
+            continue
+        if result["relative"] > reference["relative"] * (1 + tolerance) or (
+            result["blocks_per_op"] > reference.get("blocks_per_op", 0) + BLOCK_TOLERANCE
+        ):
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--save", action="store_true", help="record a new baseline")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=TOLERANCE,
+        help="allowed slowdown, as a fraction",
+    )
+    parser.add_argument(
+        "-k", dest="pattern", help="only run benchmarks whose name contains this"
+    )
+    args = parser.parse_args()
+
+    results = run(args.pattern)
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    print(
+        f"{'benchmark':<34}{'ns/op':>10}{'relative':>10}{'baseline':>10}{'change':>9}"
+        f"{'alloc B/op':>12}{'blocks/op':>11}"
+    )
+    for name, result in results.items():
+        reference = baseline.get(name, {}).get("relative")
+        if reference:
+            reference_text = f"{reference:.2f}"
+            change = f"{result['relative'] / reference - 1:+.0%}"
+        else:
+            reference_text = change = ""
+        print(
+            f"{name:<34}{result['ns_per_op']:>10.0f}{result['relative']:>10.2f}"
+            f"{reference_text:>10}{change:>9}{result['alloc_bytes_per_op']:>12}"
+            f"{result['blocks_per_op']:>11.2f}"
+        )
+
+    if args.save:
+        baseline.update(results)
+        with open(BASELINE, "w") as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write("\n")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(
+            f"Slower by more than {args.tolerance:.0%}, or leaving more blocks allocated: "
+            f"{', '.join(regressions)}"
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""Recorded websocket payloads used by the benchmarks.
+"""
+import copy
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "tests"))
+
+from stream_test import example_transaction  # noqa: E402
+
+# Uniswap V2 router swap, as delivered on an ``activeAddress`` subscription
+UNISWAP_EVENT = json.loads(example_transaction)
+UNISWAP_MESSAGE = {"version": 0, "status": "ok", "event": UNISWAP_EVENT}
+
+
+def _large_contract_call(path_length: int) -> dict:
+    """Builds a variant of the Uniswap event with a long swap path and matching calldata."""
+    event = copy.deepcopy(UNISWAP_EVENT)
+    params = event["contractCall"]["params"]
+    params["path"] = [
+        "0x%040x" % (0xC02AAA39B223FE8D0A0E5C4F27EAD9083C756CC2 + index)
+        for index in range(path_length)
+    ]
+    event["transaction"]["input"] += "00" * 32 * path_length
+    return {"version": 0, "status": "ok", "event": event}
+
+
+LARGE_MESSAGE = _large_contract_call(64)
+
+# The same messages as received on the websocket, before decoding
+UNISWAP_RAW = json.dumps(UNISWAP_MESSAGE)
+LARGE_RAW = json.dumps(LARGE_MESSAGE)
+
+RATE_LIMIT_MESSAGE = {
+    "version": 0,
+    "status": "error",
+    "reason": "ratelimit",
+    "event": {"categoryCode": "initialize", "eventCode": "checkDappId"},
+}
+
+ABI = [
+    {
+        "name": "swapExactTokensForTokens",
+        "type": "function",
+        "inputs": [
+            {"name": "amountIn", "type": "uint256"},
+            {"name": "amountOutMin", "type": "uint256"},
+            {"name": "path", "type": "address[]"},
+            {"name": "to", "type": "address"},
+            {"name": "deadline", "type": "uint256"},
+        ],
+        "outputs": [{"name": "amounts", "type": "uint256[]"}],
+        "stateMutability": "nonpayable",
+    }
+]
@@ -0,0 +1,63 @@
+"""Benchmark of warm-starting a stream from a subscription snapshot.
+
+Compares subscribing to many addresses one by one, encoding each config message, with
+loading the same subscriptions from a snapshot whose messages are already encoded.
+
+Usage::
+
+    python benchmarks/snapshot.py
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from blocknative.stream import Stream  # noqa: E402
+from payloads import ABI  # noqa: E402
+
+SUBSCRIPTION_COUNT = 20_000
+FILTERS = [{"status": "pending"}]
+
+
+async def _noop_callback(*args):
+    pass
+
+
+def subscribe_time(stream: Stream) -> float:
+    """Returns the seconds taken to subscribe to ``SUBSCRIPTION_COUNT`` addresses and encode
+    their config messages."""
+    start = time.perf_counter()
+    for index in range(SUBSCRIPTION_COUNT):
+        address = f"0x{index:040x}"
+        stream.subscribe_address(address, _noop_callback, FILTERS, ABI)
+        stream._send_config_message(address, True, FILTERS, ABI)
+    return time.perf_counter() - start
+
+
+def load_time(path: str) -> float:
+    """Returns the seconds taken to load the snapshot at ``path`` into a new stream."""
+    stream = Stream("benchmark-key")
+    start = time.perf_counter()
+    stream.load_snapshot(path, _noop_callback)
+    elapsed = time.perf_counter() - start
+    assert len(stream._subscription_registry) == SUBSCRIPTION_COUNT
+    return elapsed
+
+
+def main():
+    stream = Stream("benchmark-key")
+    subscribed = subscribe_time(stream)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "subscriptions.json")
+        stream.save_snapshot(path)
+        loaded = load_time(path)
+    print(f"{SUBSCRIPTION_COUNT} subscriptions:")
+    print(f"{'subscribing and encoding':<30}{subscribed * 1000:>10.0f}ms")
+    print(f"{'loading the snapshot':<30}{loaded * 1000:>10.0f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""Benchmarks of import time and of the cost of logging on the per-message path.
+
+Import time is measured in fresh interpreters, as a short-lived worker would pay it. The
+logging cost of an outbound message is compared between logging every message with
+``logging.debug`` and the sampled traffic trace, with the application logging at INFO and
+at DEBUG level.
+
+Usage::
+
+    python benchmarks/startup.py
+"""
+import io
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from blocknative.tracing import TrafficTrace  # noqa: E402
+from payloads import UNISWAP_MESSAGE  # noqa: E402
+
+IMPORT_RUNS = 10
+LOG_LOOPS = 100_000
+LAZY_MODULES = ("trio_websocket", "wsproto")
+
+_IMPORT_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+import blocknative.stream
+elapsed = time.perf_counter() - start
+print(elapsed, *[module in sys.modules for module in {modules!r}])
+"""
+
+
+def import_time(module_names=LAZY_MODULES) -> dict:
+    """Returns the median time to import ``blocknative.stream`` in a fresh interpreter,
+    and which of ``module_names`` the import loaded."""
+    root = os.path.join(os.path.dirname(__file__), os.pardir)
+    samples = []
+    loaded = None
+    for _ in range(IMPORT_RUNS):
+        output = subprocess.run(
+            [sys.executable, "-c", _IMPORT_SCRIPT.format(modules=module_names)],
+            cwd=root,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+        samples.append(float(output[0]))
+        loaded = [name for name, flag in zip(module_names, output[1:]) if flag == "True"]
+    return {"median_ms": statistics.median(samples) * 1000, "loaded": loaded}
+
+
+def _per_message_ns(func, message: str) -> float:
+    start = time.perf_counter_ns()
+    for _ in range(LOG_LOOPS):
+        func(message)
+    return (time.perf_counter_ns() - start) / LOG_LOOPS
+
+
+def logging_cost() -> dict:
+    """Returns the logging cost per outbound message, in nanoseconds, by approach and level."""
+    message = str(UNISWAP_MESSAGE)
+    logger = logging.getLogger("blocknative.benchmark")
+    logger.propagate = False
+    logger.addHandler(logging.StreamHandler(io.StringIO()))
+    trace = TrafficTrace(logger)
+    results = {}
+    for level in (logging.INFO, logging.DEBUG):
+        logger.setLevel(level)
+        name = logging.getLevelName(level)
+        results[f"every_message_{name}"] = _per_message_ns(
+            lambda msg: logger.debug("Sending: %s", msg), message
+        )
+        results[f"sampled_trace_{name}"] = _per_message_ns(trace.sent, message)
+    return results
+
+
+def main():
+    imported = import_time()
+    print(f"import blocknative.stream: {imported['median_ms']:.1f}ms (median of {IMPORT_RUNS})")
+    print(f"lazily imported modules loaded at import: {imported['loaded'] or 'none'}")
+    print(f"{'logging per message':<30}{'ns/op':>10}")
+    for name, cost in logging_cost().items():
+        print(f"{name:<30}{cost:>10.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
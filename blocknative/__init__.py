@@ -1 +1,6 @@
+import logging
+
 __version__ = '0.2.9'
+
+# The SDK logs to the "blocknative" logger and leaves its configuration to the application
+logging.getLogger(__name__).addHandler(logging.NullHandler())
@@ -0,0 +1,111 @@
+"""Content-addressed store of contract ABIs shared across subscriptions.
+"""
+import hashlib
+import json
+import weakref
+from collections.abc import Sequence
+from types import MappingProxyType
+from typing import List, Union
+
+
+def _freeze(value):
+    """Returns a read-only copy of a parsed JSON value."""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+class Abi(Sequence):
+    """An immutable, parsed contract ABI together with its JSON encoding.
+
+    Instances are obtained from an :class:`AbiStore`, which returns the same instance for
+    every ABI with the same content. The ABI is encoded once, so it can be embedded in any
+    number of outgoing messages without being serialized again.
+
+    Attributes:
+        digest: The SHA-256 digest of the canonical encoding, which identifies the ABI.
+        encoded: The canonical JSON encoding of the ABI.
+    """
+
+    __slots__ = ("digest", "encoded", "_entries", "__weakref__")
+
+    def __init__(self, entries: List[dict]):
+        self.encoded = json.dumps(entries, sort_keys=True, separators=(",", ":"))
+        self.digest = hashlib.sha256(self.encoded.encode()).hexdigest()
+        self._entries = _freeze(entries)
+
+    def __getitem__(self, index):
+        return self._entries[index]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Abi):
+            return self.digest == other.digest
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(self.digest)
+
+    def __repr__(self) -> str:
+        return f"Abi({self.digest[:12]}, {len(self)} entries)"
+
+    @property
+    def placeholder(self) -> str:
+        """A string which stands in for the ABI in a message until it is encoded."""
+        return f"__bn_abi_{self.digest}__"
+
+    def encode_message(self, message: dict) -> str:
+        """Encodes a message which holds ``placeholder`` in place of the ABI.
+
+        Args:
+            message: The message to encode.
+
+        Returns:
+            The JSON encoded message, with the cached encoding of the ABI spliced in.
+        """
+        return json.dumps(message).replace(f'"{self.placeholder}"', self.encoded, 1)
+
+
+class AbiStore:
+    """Parses each distinct ABI once and hands out a single shared :class:`Abi` per content.
+
+    ABIs are held weakly: once no subscription references an ABI, it is dropped from the
+    store.
+    """
+
+    def __init__(self):
+        self._by_digest = weakref.WeakValueDictionary()
+        self._by_text = weakref.WeakValueDictionary()
+
+    def __len__(self) -> int:
+        return len(self._by_digest)
+
+    def intern(self, abi: Union[Abi, List[dict], str]) -> Abi:
+        """Returns the shared instance of an ABI.
+
+        Args:
+            abi: The ABI, as a JSON string, a parsed list or an already interned ABI.
+
+        Returns:
+            The interned ABI, or None if ``abi`` is None.
+        """
+        if abi is None or isinstance(abi, Abi):
+            return abi
+        if isinstance(abi, str):
+            interned = self._by_text.get(abi)
+            if interned is None:
+                interned = self._intern(json.loads(abi))
+                self._by_text[abi] = interned
+            return interned
+        return self._intern(abi)
+
+    def _intern(self, entries: List[dict]) -> Abi:
+        candidate = Abi(entries)
+        return self._by_digest.setdefault(candidate.digest, candidate)
+
+
+abi_store = AbiStore()
@@ -0,0 +1,183 @@
+"""Block-height-indexed scheduling of N-confirmation waits.
+"""
+import heapq
+import itertools
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+import trio
+from blocknative.exceptions import TransactionDroppedError
+
+INCLUDED_CACHE_SIZE = 10_000
+
+
+class _Waiter:
+    """A task waiting for a transaction to reach a number of confirmations."""
+
+    __slots__ = (
+        "tx_hash",
+        "confirmations",
+        "event",
+        "block_number",
+        "error",
+        "discarded",
+        "_scheduler",
+    )
+
+    def __init__(self, scheduler: "ConfirmationScheduler", tx_hash: str, confirmations: int):
+        self.tx_hash = tx_hash
+        self.confirmations = confirmations
+        self.event = trio.Event()
+        self.block_number = None
+        self.error = None
+        self.discarded = False
+        self._scheduler = scheduler
+
+    async def wait(self) -> int:
+        """Waits for the confirmations. The wait is discarded if it is cancelled."""
+        try:
+            await self.event.wait()
+        finally:
+            self.discard()
+        if self.error is not None:
+            raise self.error
+        return self.block_number
+
+    def discard(self):
+        """Abandons the wait, unless it has already been resolved."""
+        if not self.event.is_set() and not self.discarded:
+            self._scheduler._discard(self)
+
+
+class ConfirmationScheduler:
+    """Resolves confirmation waits from the block numbers observed on incoming events.
+
+    Waits on transactions that are not yet included are parked by hash. Once a transaction
+    is seen confirmed in block ``B``, each of its waits for ``n`` confirmations is pushed onto
+    a min-heap keyed on the target height ``B + n - 1``. Every new chain head then pops only
+    the waits that became due, so resolving ``k`` waits out of ``n`` costs O(k log n).
+
+    The inclusion heights of the last ``INCLUDED_CACHE_SIZE`` confirmed transactions are
+    remembered, so a wait registered shortly after its transaction was confirmed still resolves.
+
+    Attributes:
+        head: The highest block number observed so far.
+    """
+
+    def __init__(self):
+        self.head = 0
+        self._included: Dict[str, int] = OrderedDict()
+        self._parked: Dict[str, List[_Waiter]] = {}
+        self._heap: List[Tuple[int, int, _Waiter]] = []
+        self._scheduled: Dict[str, int] = {}
+        self._discarded = 0
+        self._counter = itertools.count()
+
+    def __len__(self):
+        parked = sum(len(waiters) for waiters in self._parked.values())
+        return len(self._heap) - self._discarded + parked
+
+    def has_waits(self, tx_hash: str) -> bool:
+        """Tests whether any wait on ``tx_hash`` is still pending."""
+        return tx_hash in self._parked or tx_hash in self._scheduled
+
+    def watch(self, tx_hash: str, confirmations: int) -> _Waiter:
+        """Registers a wait for ``confirmations`` confirmations of ``tx_hash``.
+
+        Args:
+            tx_hash: The hash of the transaction.
+            confirmations: The number of confirmations to wait for. The block including the
+            transaction counts as the first confirmation.
+
+        Returns:
+            The waiter, whose ``wait()`` method returns the block number at which the
+            transaction reached the requested number of confirmations.
+        """
+        waiter = _Waiter(self, tx_hash, confirmations)
+        if tx_hash in self._included:
+            self._schedule(waiter, self._included[tx_hash])
+            self._resolve_due()
+        else:
+            self._parked.setdefault(tx_hash, []).append(waiter)
+        return waiter
+
+    def observe(self, transaction: dict) -> List[str]:
+        """Advances the scheduler with the transaction of an incoming event.
+
+        Args:
+            transaction: The ``transaction`` field of the event.
+
+        Returns:
+            The hashes of the included transactions whose last pending wait was resolved.
+        """
+        settled = []
+        status = transaction.get("status")
+        block_number = transaction.get("blockNumber")
+        if isinstance(block_number, int):
+            if status in ("confirmed", "failed"):
+                self._on_included(transaction["hash"], block_number, settled)
+        else:
+            block_number = transaction.get("pendingBlockNumber")
+            if status == "dropped":
+                self._on_dropped(transaction["hash"])
+
+        if isinstance(block_number, int) and block_number > self.head:
+            self.head = block_number
+            self._resolve_due(settled)
+        return settled
+
+    def _on_included(self, tx_hash: str, block_number: int, settled: List[str] = None):
+        self._included[tx_hash] = block_number
+        if len(self._included) > INCLUDED_CACHE_SIZE:
+            self._included.popitem(last=False)
+        for waiter in self._parked.pop(tx_hash, ()):
+            self._schedule(waiter, block_number)
+        self._resolve_due(settled)
+
+    def _on_dropped(self, tx_hash: str):
+        for waiter in self._parked.pop(tx_hash, ()):
+            waiter.error = TransactionDroppedError(tx_hash)
+            waiter.event.set()
+
+    def _discard(self, waiter: _Waiter):
+        """Removes an abandoned wait. Scheduled waits are marked, and skipped when due."""
+        waiter.discarded = True
+        parked = self._parked.get(waiter.tx_hash)
+        if parked is not None and waiter in parked:
+            parked.remove(waiter)
+            if not parked:
+                del self._parked[waiter.tx_hash]
+            return
+
+        self._unschedule(waiter.tx_hash)
+        self._discarded += 1
+        if self._discarded > len(self._heap) // 2:
+            # Compact the heap once most of it is abandoned waits
+            self._heap = [entry for entry in self._heap if not entry[2].discarded]
+            heapq.heapify(self._heap)
+            self._discarded = 0
+
+    def _schedule(self, waiter: _Waiter, block_number: int):
+        target = block_number + waiter.confirmations - 1
+        heapq.heappush(self._heap, (target, next(self._counter), waiter))
+        self._scheduled[waiter.tx_hash] = self._scheduled.get(waiter.tx_hash, 0) + 1
+
+    def _unschedule(self, tx_hash: str) -> bool:
+        """Counts a scheduled wait out. Returns whether it was the last one of ``tx_hash``."""
+        remaining = self._scheduled[tx_hash] - 1
+        if remaining:
+            self._scheduled[tx_hash] = remaining
+            return False
+        del self._scheduled[tx_hash]
+        return True
+
+    def _resolve_due(self, settled: List[str] = None):
+        heap = self._heap
+        while heap and heap[0][0] <= self.head:
+            _, _, waiter = heapq.heappop(heap)
+            if waiter.discarded:
+                self._discarded -= 1
+                continue
+            waiter.block_number = self.head
+            waiter.event.set()
+            if self._unschedule(waiter.tx_hash) and settled is not None:
+                settled.append(waiter.tx_hash)
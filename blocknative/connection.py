@@ -0,0 +1,526 @@
+"""
+Websocket connection setup.
+"""
+import logging
+import ssl
+import time
+import zlib
+import urllib.parse
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable
+import trio
+
+# trio_websocket and wsproto are imported when the first connection is opened
+if TYPE_CHECKING:
+    from trio_websocket import WebSocketConnection
+    from wsproto.extensions import PerMessageDeflate
+
+CONNECT_TIMEOUT = 60
+DISCONNECT_TIMEOUT = 60
+ABORT_TIMEOUT = 1  # seconds to close a connection that failed, whose peer may be gone
+MESSAGE_QUEUE_SIZE = 256  # messages read off the socket ahead of the consumer
+DNS_TTL = 60  # seconds
+STANDBY_MAX_AGE = 20  # seconds
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Compression:
+    """Dataclass representing the permessage-deflate settings offered to the server.
+
+    Attributes:
+        window_bits: The base-two logarithm of the LZ77 sliding window size, between 9 and 15.
+        Applies to both directions. Smaller windows use less memory but compress less.
+        memory_level: The zlib memory level used to compress outbound messages, between 1 and 9.
+        no_context_takeover: Whether both ends should reset their compression context after
+        every message, trading compression ratio for memory.
+    """
+
+    window_bits: int = 15
+    memory_level: int = 8
+    no_context_takeover: bool = False
+
+    def extension(self) -> "PerMessageDeflate":
+        """Builds the wsproto extension to offer in the opening handshake.
+
+        Returns:
+            The permessage-deflate extension.
+        """
+        return _per_message_deflate_class()(
+            self.memory_level,
+            client_no_context_takeover=self.no_context_takeover,
+            client_max_window_bits=self.window_bits,
+            server_no_context_takeover=self.no_context_takeover,
+            server_max_window_bits=self.window_bits,
+        )
+
+
+@lru_cache(maxsize=None)
+def _per_message_deflate_class():
+    """Defines the permessage-deflate extension on first use, so wsproto is only imported
+    when compression is enabled."""
+    from wsproto.extensions import PerMessageDeflate
+    from wsproto.frame_protocol import Opcode
+
+    class _PerMessageDeflate(PerMessageDeflate):
+        """permessage-deflate extension which compresses with a configurable zlib memory level."""
+
+        def __init__(self, memory_level: int, **kwargs):
+            super().__init__(**kwargs)
+            self.memory_level = memory_level
+
+        def frame_outbound(self, proto, opcode, rsv, data, fin):
+            if self._compressor is None and opcode in (Opcode.TEXT, Opcode.BINARY):
+                bits = (
+                    self.client_max_window_bits
+                    if proto.client
+                    else self.server_max_window_bits
+                )
+                self._compressor = zlib.compressobj(
+                    zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -bits, self.memory_level
+                )
+            return super().frame_outbound(proto, opcode, rsv, data, fin)
+
+    return _PerMessageDeflate
+
+
+@dataclass
+class TransportStats:
+    """Dataclass representing the bytes exchanged on the wire, accumulated across reconnects.
+
+    Attributes:
+        bytes_sent: The number of bytes written to the transport.
+        bytes_received: The number of bytes read from the transport.
+    """
+
+    bytes_sent: int = 0
+    bytes_received: int = 0
+
+
+class _MeteredStream(trio.abc.Stream):
+    """Stream wrapper which counts the bytes going over the wrapped transport, and reports
+    when data arrives, before it is queued for the consumer."""
+
+    def __init__(
+        self,
+        transport: trio.abc.Stream,
+        stats: TransportStats = None,
+        on_receive: Callable[[], None] = None,
+    ):
+        self.transport = transport
+        self.stats = stats
+        self.on_receive = on_receive
+
+    async def send_all(self, data):
+        await self.transport.send_all(data)
+        if self.stats is not None:
+            self.stats.bytes_sent += len(data)
+
+    async def wait_send_all_might_not_block(self):
+        await self.transport.wait_send_all_might_not_block()
+
+    async def receive_some(self, max_bytes=None):
+        data = await self.transport.receive_some(max_bytes)
+        if self.stats is not None:
+            self.stats.bytes_received += len(data)
+        if data and self.on_receive is not None:
+            self.on_receive()
+        return data
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def _parse_url(url: str):
+    """Splits a websocket url into its host, port, resource and whether it uses TLS."""
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ("ws", "wss"):
+        raise ValueError('WebSocket URL scheme must be "ws:" or "wss:"')
+    use_ssl = parts.scheme == "wss"
+    port = parts.port or (443 if use_ssl else 80)
+    resource = parts.path or "/"
+    if parts.query:
+        resource += "?" + parts.query
+    return parts.hostname, port, resource, use_ssl
+
+
+@dataclass
+class HandshakeTimings:
+    """Dataclass representing the time spent in each step of opening a connection.
+
+    Attributes:
+        dns: Seconds spent resolving the host name. Zero when the address was cached.
+        tcp: Seconds spent establishing the TCP connection.
+        tls: Seconds spent in the TLS handshake.
+        upgrade: Seconds spent in the websocket upgrade request.
+        dns_cached: Whether the resolved addresses came from the cache.
+        session_reused: Whether the TLS session was resumed rather than negotiated in full.
+        standby: Whether a pre-warmed standby connection was used, skipping DNS, TCP and TLS.
+    """
+
+    dns: float = 0.0
+    tcp: float = 0.0
+    tls: float = 0.0
+    upgrade: float = 0.0
+    dns_cached: bool = False
+    session_reused: bool = False
+    standby: bool = False
+
+    @property
+    def total(self) -> float:
+        """The total number of seconds spent opening the connection."""
+        return self.dns + self.tcp + self.tls + self.upgrade
+
+
+@dataclass
+class _Standby:
+    """A pre-warmed TCP/TLS connection waiting to be upgraded to a websocket."""
+
+    opened_at: float
+    transport: trio.abc.Stream
+    tls: trio.SSLStream = None
+
+
+class Connector:
+    """Opens the transport of websocket connections, reusing work across reconnects.
+
+    A connector keeps a single ``ssl.SSLContext`` and the TLS session of each host, so that
+    reconnects resume the session instead of performing a full handshake. Resolved addresses
+    are cached for ``dns_ttl`` seconds; if connecting to an address fails, the next one is
+    tried. With ``prewarm``, a standby TCP/TLS connection to the host is kept open while
+    connected, and used by the next reconnect as long as it is younger than
+    ``standby_max_age`` seconds. A single task keeps the standby of each host fresh, however
+    many connections to it are open. Call ``aclose`` once done to close it.
+
+    Args:
+        ssl_context: The TLS configuration. Defaults to ``ssl.create_default_context()``.
+        dns_ttl: The number of seconds resolved addresses are cached for.
+        prewarm: Whether to keep a standby connection open.
+        standby_max_age: The number of seconds after which a standby connection is replaced.
+
+    Attributes:
+        timings: The handshake timings of the most recently opened connection.
+    """
+
+    def __init__(
+        self,
+        ssl_context: ssl.SSLContext = None,
+        dns_ttl: float = DNS_TTL,
+        prewarm: bool = False,
+        standby_max_age: float = STANDBY_MAX_AGE,
+    ):
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self.dns_ttl = dns_ttl
+        self.prewarm = prewarm
+        self.standby_max_age = standby_max_age
+        self.timings = HandshakeTimings()
+        self._addresses = {}
+        self._sessions = {}
+        self._standby = {}
+        self._standby_tasks = {}
+
+    async def open_transport(
+        self, host: str, port: int, use_ssl: bool, timings: HandshakeTimings
+    ):
+        """Opens a TCP connection, wrapped in TLS if ``use_ssl``, recording its timings.
+
+        Returns:
+            A tuple of the transport stream and the TLS stream, or None without TLS.
+        """
+        start = time.perf_counter()
+        addresses = self._addresses.get((host, port))
+        if addresses is not None and addresses[0] > time.monotonic():
+            timings.dns_cached = True
+            addresses = addresses[1]
+        else:
+            addresses = await trio.socket.getaddrinfo(
+                host, port, type=trio.socket.SOCK_STREAM
+            )
+            self._addresses[(host, port)] = (time.monotonic() + self.dns_ttl, addresses)
+        timings.dns = 0.0 if timings.dns_cached else time.perf_counter() - start
+
+        start = time.perf_counter()
+        transport = await self._connect_tcp(host, port, addresses)
+        timings.tcp = time.perf_counter() - start
+        if not use_ssl:
+            return transport, None
+
+        start = time.perf_counter()
+        tls = trio.SSLStream(
+            transport, self.ssl_context, server_hostname=host, https_compatible=True
+        )
+        session = self._sessions.get((host, port))
+        if session is not None:
+            tls.session = session
+        try:
+            await tls.do_handshake()
+        except BaseException:
+            await trio.aclose_forcefully(tls)
+            raise
+        timings.tls = time.perf_counter() - start
+        timings.session_reused = tls.session_reused
+        return tls, tls
+
+    async def _connect_tcp(self, host: str, port: int, addresses: list):
+        """Connects to the first address that accepts the connection."""
+        error = None
+        for index, (family, type_, proto, _, sockaddr) in enumerate(addresses):
+            sock = trio.socket.socket(family, type_, proto)
+            try:
+                await sock.connect(sockaddr)
+            except OSError as exc:
+                sock.close()
+                error = exc
+                continue
+            if index > 0:
+                # Try the address that worked first from now on
+                expires_at, _ = self._addresses[(host, port)]
+                reordered = addresses[index:] + addresses[:index]
+                self._addresses[(host, port)] = (expires_at, reordered)
+            return trio.SocketStream(sock)
+
+        # Resolve again next time, the cached addresses may be outdated
+        self._addresses.pop((host, port), None)
+        raise error or OSError(f"No address found for {host}:{port}")
+
+    def save_session(self, host: str, port: int, tls: trio.SSLStream):
+        """Remembers the TLS session of a connection, to resume it on the next one."""
+        session = tls.session
+        if session is not None:
+            self._sessions[(host, port)] = session
+
+    async def take_standby(self, host: str, port: int, use_ssl: bool) -> _Standby:
+        """Returns the standby connection to a host, or None if there is no fresh one."""
+        standby = self._standby.pop((host, port, use_ssl), None)
+        if standby is None:
+            return None
+        if time.monotonic() - standby.opened_at >= self.standby_max_age:
+            await trio.aclose_forcefully(standby.transport)
+            return None
+        return standby
+
+    async def keep_standby(self, host: str, port: int, use_ssl: bool):
+        """In a loop: Keeps a fresh standby connection to a host open.
+
+        Returns immediately if another task already keeps the standby of the host.
+
+        Note:
+            This function runs until cancelled, or until ``stop_standby`` is called.
+        """
+        key = (host, port, use_ssl)
+        if key in self._standby_tasks:
+            return
+        with trio.CancelScope() as scope:
+            self._standby_tasks[key] = scope
+            try:
+                await self._refresh_standby(key, scope)
+            finally:
+                if self._standby_tasks.get(key) is scope:
+                    del self._standby_tasks[key]
+
+    async def _refresh_standby(self, key: tuple, scope: trio.CancelScope):
+        """In a loop: Replaces the standby connection of a host before it gets too old."""
+        host, port, use_ssl = key
+        while True:
+            standby = self._standby.get(key)
+            if standby is None or (
+                time.monotonic() - standby.opened_at >= self.standby_max_age
+            ):
+                if standby is not None:
+                    del self._standby[key]
+                    await trio.aclose_forcefully(standby.transport)
+                try:
+                    transport, tls = await self.open_transport(
+                        host, port, use_ssl, HandshakeTimings()
+                    )
+                except OSError:
+                    logger.debug("Failed to open standby connection to %s", host)
+                    await trio.sleep(self.standby_max_age)
+                    continue
+                if self._standby_tasks.get(key) is not scope:
+                    # Stopped while connecting, another task may own the standby by now
+                    await trio.aclose_forcefully(transport)
+                    return
+                standby = _Standby(time.monotonic(), transport, tls)
+                self._standby[key] = standby
+            await trio.sleep(
+                max(0, standby.opened_at + self.standby_max_age - time.monotonic())
+            )
+
+    def stop_standby(self, url: str):
+        """Stops refreshing the standby connection of a websocket url, if it is kept.
+
+        The current standby connection is left open, for the next connection to use.
+        """
+        host, port, _, use_ssl = _parse_url(url)
+        scope = self._standby_tasks.pop((host, port, use_ssl), None)
+        if scope is not None:
+            scope.cancel()
+
+    async def aclose(self):
+        """Stops refreshing the standby connections and closes them."""
+        for scope in self._standby_tasks.values():
+            scope.cancel()
+        self._standby_tasks.clear()
+        standbys = list(self._standby.values())
+        self._standby.clear()
+        for standby in standbys:
+            await trio.aclose_forcefully(standby.transport)
+
+
+async def _wait_any(*events: trio.Event):
+    """Waits until any of the events is set."""
+    async with trio.open_nursery() as nursery:
+
+        async def wait(event):
+            await event.wait()
+            nursery.cancel_scope.cancel()
+
+        for event in events:
+            nursery.start_soon(wait, event)
+
+
+async def _upgrade(
+    nursery: trio.Nursery,
+    transport: trio.abc.Stream,
+    host: str,
+    resource: str,
+    compression: Compression,
+    stats: TransportStats,
+    timings: HandshakeTimings,
+    on_receive: Callable[[], None] = None,
+) -> "WebSocketConnection":
+    """Performs the websocket upgrade over an open transport.
+
+    trio-websocket has no public way to offer extensions or to upgrade a pre-warmed
+    transport without blocking on the handshake, so this relies on its internals. The
+    supported releases are bounded in ``setup.py``.
+
+    Returns:
+        The websocket connection, or None if the transport closed during the upgrade.
+    """
+    from trio_websocket import WebSocketConnection
+    from wsproto import ConnectionType, WSConnection
+
+    start = time.perf_counter()
+    if stats is not None or on_receive is not None:
+        transport = _MeteredStream(transport, stats, on_receive)
+
+    ws = WebSocketConnection(
+        transport,
+        WSConnection(ConnectionType.CLIENT),
+        host=host,
+        path=resource,
+        message_queue_size=MESSAGE_QUEUE_SIZE,
+    )
+    if compression is not None:
+        ws._initial_request = replace(
+            ws._initial_request, extensions=[compression.extension()]
+        )
+
+    reader_done = trio.Event()
+
+    async def read():
+        try:
+            await ws._reader_task()
+        finally:
+            reader_done.set()
+
+    nursery.start_soon(read)
+    await _wait_any(ws._open_handshake, reader_done)
+    timings.upgrade = time.perf_counter() - start
+    return ws if ws._open_handshake.is_set() else None
+
+
+@asynccontextmanager
+async def open_websocket(
+    url: str,
+    compression: Compression = None,
+    stats: TransportStats = None,
+    connector: Connector = None,
+    on_receive: Callable[[], None] = None,
+):
+    """Opens a websocket client connection, optionally negotiating permessage-deflate.
+
+    Args:
+        url: The websocket url to connect to.
+        compression: The compression settings to offer. The server may decline them, in
+        which case the connection is left uncompressed.
+        stats: Accumulates the number of bytes exchanged on the wire.
+        connector: Opens the transport, reusing TLS sessions, resolved addresses and standby
+        connections across calls. Its ``timings`` are updated once the connection is open.
+        on_receive: Called whenever data arrives on the connection, even if the consumer
+        has fallen behind reading messages.
+
+    Raises:
+        HandshakeError: If the connection could not be established.
+    """
+    from trio_websocket import HandshakeError, ConnectionTimeout
+
+    connector = connector or Connector()
+    host, port, resource, use_ssl = _parse_url(url)
+    host_header = host if port in (80, 443) else f"{host}:{port}"
+    async with trio.open_nursery() as nursery:
+        try:
+            with trio.fail_after(CONNECT_TIMEOUT):
+                ws = None
+                standby = await connector.take_standby(host, port, use_ssl)
+                if standby is not None:
+                    timings = HandshakeTimings(standby=True)
+                    tls = standby.tls
+                    ws = await _upgrade(
+                        nursery,
+                        standby.transport,
+                        host_header,
+                        resource,
+                        compression,
+                        stats,
+                        timings,
+                        on_receive,
+                    )
+                    if ws is None:
+                        # The server closed the idle standby, open a fresh connection
+                        await trio.aclose_forcefully(standby.transport)
+
+                if ws is None:
+                    timings = HandshakeTimings()
+                    transport, tls = await connector.open_transport(
+                        host, port, use_ssl, timings
+                    )
+                    ws = await _upgrade(
+                        nursery,
+                        transport,
+                        host_header,
+                        resource,
+                        compression,
+                        stats,
+                        timings,
+                        on_receive,
+                    )
+                    if ws is None:
+                        raise HandshakeError("Connection closed during the handshake")
+        except trio.TooSlowError:
+            raise ConnectionTimeout from None
+        except OSError as error:
+            raise HandshakeError from error
+
+        connector.timings = timings
+        logger.debug("Connected to %s: %s", url, timings)
+        if tls is not None:
+            # Session tickets are sent after the handshake, save it again now
+            connector.save_session(host, port, tls)
+        if connector.prewarm:
+            nursery.start_soon(connector.keep_standby, host, port, use_ssl)
+
+        timeout = ABORT_TIMEOUT
+        try:
+            yield ws
+            timeout = DISCONNECT_TIMEOUT
+        finally:
+            # Don't wait for the closing handshake of a failed connection before reconnecting
+            with trio.move_on_after(timeout):
+                await ws.aclose()
+            nursery.cancel_scope.cancel()
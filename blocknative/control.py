@@ -0,0 +1,109 @@
+"""Thread-safe control of a running stream.
+"""
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Iterable, List
+import trio
+
+
+class StreamController:
+    """Thread-safe handle for changing the subscriptions of a stream from other threads.
+
+    ``Stream.connect()`` blocks its thread inside the trio event loop. Calls made on the
+    controller from any other thread are handed to that loop through its ``TrioToken`` and
+    applied there, so the subscription registry is only ever mutated by the loop. Requests
+    submitted while the loop is busy are applied together in its next turn. If the stream is
+    not running, requests are applied immediately in the calling thread and the subscriptions
+    are sent once the stream connects.
+
+    Every method returns a :class:`concurrent.futures.Future` which resolves once the request
+    has been applied and its messages have been queued for sending.
+
+    Example:
+
+    .. code-block:: python
+
+        stream = Stream(API_KEY)
+        threading.Thread(target=stream.connect, daemon=True).start()
+
+        future = stream.control.subscribe_address(address, callback)
+        future.result(timeout=1)
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._requests = deque()
+        self._lock = threading.Lock()
+        self._drain_scheduled = False
+
+    def subscribe_address(self, address: str, callback: Callable, **kwargs) -> Future:
+        """Thread-safe version of ``Stream.subscribe_address``."""
+        return self._submit(
+            lambda stream: stream.subscribe_address(address, callback, **kwargs)
+        )
+
+    def subscribe_txn(self, tx_hash: str, callback: Callable, **kwargs) -> Future:
+        """Thread-safe version of ``Stream.subscribe_txn``."""
+        return self._submit(lambda stream: stream.subscribe_txn(tx_hash, callback, **kwargs))
+
+    def update_subscription(self, address: str, **kwargs) -> Future:
+        """Thread-safe version of ``Stream.update_subscription``."""
+        return self._submit(lambda stream: stream.update_subscription(address, **kwargs))
+
+    def unsubscribe(self, key: str) -> Future:
+        """Thread-safe version of ``Stream.unsubscribe``."""
+        return self._submit(lambda stream: stream.unsubscribe(key))
+
+    def unsubscribe_many(self, keys: Iterable[str]) -> Future:
+        """Thread-safe version of ``Stream.unsubscribe_many``."""
+        keys = list(keys)
+        return self._submit(lambda stream: stream.unsubscribe_many(keys))
+
+    def submit(self, operations: Iterable[Callable[[Any], Any]]) -> Future:
+        """Applies several operations on the stream in a single turn of its event loop.
+
+        Args:
+            operations: Functions which take the stream as their only argument.
+
+        Returns:
+            A future which resolves to the list of the operations' return values.
+        """
+        operations = list(operations)
+        return self._submit(lambda stream: [operation(stream) for operation in operations])
+
+    def _submit(self, operation: Callable[[Any], Any]) -> Future:
+        future = Future()
+        token = self._stream._trio_token
+        if token is None or self._stream._in_loop_thread():
+            self._apply(operation, future)
+            return future
+
+        with self._lock:
+            self._requests.append((operation, future))
+            schedule = not self._drain_scheduled
+            self._drain_scheduled = True
+        if schedule:
+            try:
+                token.run_sync_soon(self._drain)
+            except trio.RunFinishedError:
+                # The stream stopped in the meantime, apply in this thread instead
+                self._drain()
+        return future
+
+    def _drain(self):
+        """Applies every pending request. Runs in the stream's event loop."""
+        with self._lock:
+            requests: List = list(self._requests)
+            self._requests.clear()
+            self._drain_scheduled = False
+        for operation, future in requests:
+            self._apply(operation, future)
+
+    def _apply(self, operation: Callable[[Any], Any], future: Future):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(operation(self._stream))
+        except Exception as error:  # pylint: disable=broad-except
+            future.set_exception(error)
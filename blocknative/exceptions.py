@@ -38,3 +38,7 @@ class MissingAPIKeyError(SDKError):
 
 class InvalidAPIKeyError(SDKError):
     """Raised when the API key is invalid"""
+
+
+class TransactionDroppedError(SDKError):
+    """Raised when waiting for confirmations of a transaction that was dropped"""
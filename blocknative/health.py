@@ -0,0 +1,123 @@
+"""Connection health monitoring based on ping round-trip times.
+"""
+import time
+
+MIN_PING_INTERVAL = 2
+MAX_PING_INTERVAL = 15
+MIN_PING_TIMEOUT = 3  # tolerates the RTT jitter of a healthy connection
+MAX_PING_TIMEOUT = 10
+PING_INTERVAL_FACTOR = 3  # ping interval, in multiples of the ping timeout
+RTT_ALPHA = 1 / 8
+RTT_BETA = 1 / 4
+RTT_SAMPLE_INTERVAL = 30  # seconds between pings which refresh the RTT of a busy connection
+
+
+class ConnectionHealth:
+    """Tracks the liveness and the round-trip time of the websocket connection.
+
+    Round-trip times measured by pings are smoothed as in TCP's retransmission timer
+    (RFC 6298). Any data received counts as proof of liveness as soon as it arrives, rather
+    than once the application reads it, so a slow consumer does not make a healthy connection
+    look dead. Once the connection has been silent for ``ping_interval`` seconds a ping is
+    sent, which must be answered within ``ping_timeout`` seconds. Both are derived from the
+    measured round-trip time, so a dead path is detected after at most ``silence_threshold``
+    seconds.
+
+    The round-trip time is sampled as soon as a connection opens, and again every
+    ``sample_interval`` seconds even while traffic flows, so the thresholds of a busy
+    connection adapt too instead of staying at their upper bounds.
+
+    Args:
+        min_interval: The lower bound of the ping interval.
+        max_interval: The upper bound of the ping interval, used until an RTT is measured.
+        min_timeout: The lower bound of the ping timeout.
+        max_timeout: The upper bound of the ping timeout, used until an RTT is measured.
+        sample_interval: The number of seconds after which the RTT is sampled again.
+
+    Attributes:
+        srtt: The smoothed round-trip time in seconds, or None before the first sample.
+        rttvar: The round-trip time variation in seconds, or None before the first sample.
+        last_activity: The monotonic time at which the connection last received data.
+        last_sample: The monotonic time of the last RTT sample on the current connection,
+        or None if none was taken yet.
+    """
+
+    def __init__(
+        self,
+        min_interval: float = MIN_PING_INTERVAL,
+        max_interval: float = MAX_PING_INTERVAL,
+        min_timeout: float = MIN_PING_TIMEOUT,
+        max_timeout: float = MAX_PING_TIMEOUT,
+        sample_interval: float = RTT_SAMPLE_INTERVAL,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.sample_interval = sample_interval
+        self.srtt = None
+        self.rttvar = None
+        self.last_activity = time.monotonic()
+        self.last_sample = None
+
+    @property
+    def ping_timeout(self) -> float:
+        """The number of seconds to wait for a pong before considering the connection dead."""
+        if self.srtt is None:
+            return self.max_timeout
+        rto = self.srtt + 4 * self.rttvar
+        return min(self.max_timeout, max(self.min_timeout, rto))
+
+    @property
+    def ping_interval(self) -> float:
+        """The number of seconds of silence after which a ping is sent."""
+        if self.srtt is None:
+            return self.max_interval
+        interval = PING_INTERVAL_FACTOR * self.ping_timeout
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    @property
+    def silence_threshold(self) -> float:
+        """The longest silence tolerated before the connection is considered dead."""
+        return self.ping_interval + self.ping_timeout
+
+    def next_ping(self) -> float:
+        """Returns the number of seconds until a ping is due, either because the connection
+        has been silent for ``ping_interval`` seconds or because the RTT needs a new sample."""
+        if self.last_sample is None:
+            return 0
+        now = time.monotonic()
+        silence = self.last_activity + self.ping_interval - now
+        sample = self.last_sample + self.sample_interval - now
+        return max(0, min(silence, sample))
+
+    def idle_time(self) -> float:
+        """Returns the number of seconds since the connection last received data."""
+        return time.monotonic() - self.last_activity
+
+    def reset(self):
+        """Marks a newly established connection as alive. Keeps the measured RTT, but
+        requests a new sample."""
+        self.last_activity = time.monotonic()
+        self.last_sample = None
+
+    def on_activity(self):
+        """Records that the connection received data."""
+        self.last_activity = time.monotonic()
+
+    def on_rtt(self, sample: float):
+        """Records the round-trip time of an answered ping.
+
+        Args:
+            sample: The round-trip time in seconds.
+        """
+        if self.srtt is None:
+            self.srtt = sample
+            self.rttvar = sample / 2
+        else:
+            self.rttvar = (1 - RTT_BETA) * self.rttvar + RTT_BETA * abs(
+                self.srtt - sample
+            )
+            self.srtt = (1 - RTT_ALPHA) * self.srtt + RTT_ALPHA * sample
+        self.last_sample = time.monotonic()
+        self.on_activity()
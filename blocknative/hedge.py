@@ -0,0 +1,86 @@
+"""First-arrival delivery of events received on hedged connections.
+"""
+import time
+from collections import Counter, OrderedDict, deque
+from typing import Hashable
+
+SEEN_CAPACITY = 100_000
+GAP_SAMPLES = 10_000
+
+
+class HedgeStats:
+    """Statistics on the race between hedged connections.
+
+    Attributes:
+        wins: The number of events each leg delivered first, by leg name.
+        gaps: The most recent latency gaps, in seconds, between the first and second copy
+        of an event.
+    """
+
+    def __init__(self, max_samples: int = GAP_SAMPLES):
+        self.wins = Counter()
+        self.gaps = deque(maxlen=max_samples)
+
+    def record(self, winner: str, gap: float):
+        """Records that ``winner`` delivered an event ``gap`` seconds before the other leg."""
+        self.wins[winner] += 1
+        self.gaps.append(gap)
+
+    def percentile(self, q: float) -> float:
+        """Returns the ``q``-th percentile of the recorded latency gaps, in seconds.
+
+        Args:
+            q: The percentile, between 0 and 100.
+        """
+        if not self.gaps:
+            return 0.0
+        ordered = sorted(self.gaps)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+    def summary(self) -> dict:
+        """Returns the win counts and the median and p99 latency gaps."""
+        return {
+            "wins": dict(self.wins),
+            "gap_p50": self.percentile(50),
+            "gap_p99": self.percentile(99),
+        }
+
+
+class FirstArrivalFilter:
+    """Lets through the first copy of each event and drops the copy from the other leg.
+
+    Keys of events that have only been seen on one leg are kept in insertion order and the
+    oldest are evicted beyond ``capacity``, which bounds memory if a leg misses events.
+
+    Args:
+        stats: Where to record the winner and the latency gap of each race.
+        capacity: The maximum number of keys awaiting their second copy.
+    """
+
+    def __init__(self, stats: HedgeStats, capacity: int = SEEN_CAPACITY):
+        self.stats = stats
+        self.capacity = capacity
+        self._seen = OrderedDict()
+
+    def first_arrival(self, key: Hashable, leg: str) -> bool:
+        """Determines if an event is the first copy to arrive.
+
+        Args:
+            key: The key identifying the event.
+            leg: The name of the leg the event arrived on.
+
+        Returns:
+            True if the event should be delivered, False if it is a duplicate.
+        """
+        now = time.monotonic()
+        seen = self._seen.pop(key, None)
+        if seen is None or seen[0] == leg:
+            # A repeat on the same leg is a distinct event, not a hedged copy
+            self._seen[key] = (leg, now)
+            if len(self._seen) > self.capacity:
+                self._seen.popitem(last=False)
+            return True
+
+        winner, first_seen = seen
+        self.stats.record(winner, now - first_seen)
+        return False
@@ -0,0 +1,185 @@
+"""
+Blocknative Multi Network Stream.
+"""
+from collections.abc import MutableMapping
+from typing import Callable, Dict, List, Tuple, Union
+import trio
+from blocknative.stream import (
+    Stream,
+    Subscription,
+    BN_BASE_URL,
+    BN_ETHEREUM,
+)
+from blocknative.utils import network_id_to_name
+
+EVENT_BUFFER_SIZE = 1024
+
+NetworkCallback = Callable[[str, dict, Callable], None]
+
+
+class _NetworkRegistry(MutableMapping):
+    """View of the shared ``(network, key)`` registry as seen by a single network's stream."""
+
+    def __init__(self, registry: Dict[Tuple[str, str], Subscription], network: str):
+        self._registry = registry
+        self._network = network
+
+    def __getitem__(self, key):
+        return self._registry[(self._network, key)]
+
+    def __setitem__(self, key, subscription):
+        self._registry[(self._network, key)] = subscription
+
+    def __delitem__(self, key):
+        del self._registry[(self._network, key)]
+
+    def __contains__(self, key):
+        return (self._network, key) in self._registry
+
+    def __iter__(self):
+        return (key for network, key in list(self._registry) if network == self._network)
+
+    def __len__(self):
+        return sum(1 for network, _ in self._registry if network == self._network)
+
+
+class MultiNetworkStream:
+    """Runs one connection per network inside a single trio event loop.
+
+    Every event is tagged with the name of the network it was received on and delivered
+    either to ``callback`` or, if no callback is given, to the :meth:`events` iterator.
+
+    Args:
+        api_key: The api key. Get one at `blocknative.com <https://explorer.blocknative.com/?signup=true/>`_.
+        network_ids: The ids of the networks to connect to. For instance, ``[1, 56, 137, 250]``.
+        callback: The callback function that will get executed for every event on every network.
+        It receives the network name, the transaction and an unsubscribe function.
+        blockchain: The blockchain the networks belong to. Default is ``ethereum``.
+        global_filters: The filters that will be applied globally to every network.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        network_ids: List[int],
+        callback: NetworkCallback = None,
+        blockchain: str = BN_ETHEREUM,
+        global_filters: List[dict] = None,
+    ):
+        self.callback = callback
+        self._subscription_registry: Dict[Tuple[str, str], Subscription] = {}
+        self._streams: Dict[str, Stream] = {}
+        self._send_channel, self._receive_channel = trio.open_memory_channel(
+            EVENT_BUFFER_SIZE
+        )
+
+        for network_id in network_ids:
+            network = network_id_to_name(network_id)
+            stream = Stream(api_key, blockchain, network_id, global_filters)
+            stream._subscription_registry = _NetworkRegistry(
+                self._subscription_registry, network
+            )
+            self._streams[network] = stream
+
+    def stream(self, network_id: int) -> Stream:
+        """Returns the stream connected to the given network.
+
+        Args:
+            network_id: The id of the network.
+
+        Raises:
+            KeyError: If the network was not passed to the constructor.
+        """
+        return self._streams[network_id_to_name(network_id)]
+
+    def subscribe_address(
+        self,
+        network_id: int,
+        address: str,
+        filters: List[dict] = None,
+        abi: Union[List[dict], str] = None,
+    ):
+        """Subscribes to an address on the given network.
+
+        Args:
+            network_id: The id of the network the address lives on.
+            address: The address to watch for incoming and outgoing transactions.
+            filters: The filters by which to filter the transactions associated with the address.
+            abi: The ABI of the contract. Used if `address` is a contract address.
+        """
+        network = network_id_to_name(network_id)
+
+        async def callback(transaction, unsubscribe):
+            await self._deliver(network, transaction, unsubscribe)
+
+        self.stream(network_id).subscribe_address(address, callback, filters, abi)
+
+    def subscribe_txn(self, network_id: int, tx_hash: str, status: str = "sent"):
+        """Subscribes to a transaction on the given network.
+
+        Args:
+            network_id: The id of the network the transaction was sent to.
+            tx_hash: The hash of the transaction to watch.
+            status: The status of the transaction to receive events for.
+        """
+        network = network_id_to_name(network_id)
+        stream = self.stream(network_id)
+
+        async def callback(transaction):
+            await self._deliver(
+                network, transaction, lambda: stream.unsubscribe(tx_hash)
+            )
+
+        stream.subscribe_txn(tx_hash, callback, status)
+
+    def unsubscribe(self, network_id: int, key: str):
+        """Removes the subscription for an address or transaction on the given network.
+
+        Args:
+            network_id: The id of the network.
+            key: The address or transaction hash to unsubscribe from.
+        """
+        self.stream(network_id).unsubscribe(key)
+
+    async def events(self):
+        """Iterates over the events received on every network.
+
+        Only used if no ``callback`` was given.
+
+        Yields:
+            Tuples of the network name and the transaction.
+        """
+        async for network, transaction in self._receive_channel:
+            yield network, transaction
+
+    async def run(self, base_url: str = BN_BASE_URL):
+        """Connects to every network and runs until cancelled.
+
+        Each network's stream runs as ``Stream.connect`` would run it, and closes its
+        connector once done.
+
+        Args:
+            base_url: The websocket url to connect to. Useful for when using a proxy.
+        """
+        async with trio.open_nursery() as nursery:
+            for stream in self._streams.values():
+                nursery.start_soon(stream._run, base_url)
+
+    def connect(self, base_url: str = BN_BASE_URL):
+        """Initializes the connections to the WebSocket server.
+
+        Args:
+            base_url: The websocket url to connect to. Useful for when using a proxy.
+        """
+        try:
+            return trio.run(self.run, base_url)
+        except KeyboardInterrupt:
+            print("keyboard interrupt")
+            return None
+
+    async def _deliver(self, network: str, transaction: dict, unsubscribe: Callable):
+        """Hands an event to the user's callback, or to the events iterator."""
+        if self.callback is not None:
+            await self.callback(network, transaction, unsubscribe)
+        else:
+            await self._send_channel.send((network, transaction))
@@ -0,0 +1,207 @@
+"""On-demand profiling of the stages of a running stream.
+"""
+import json
+import logging
+import signal
+import time
+import trio
+
+PROFILE_WINDOW = 30  # seconds
+FORMATS = ("collapsed", "json")
+
+logger = logging.getLogger(__name__)
+
+
+class Profiler:
+    """Times the stages of a stream's receive and send loops while enabled.
+
+    Stages are named as stacks of frames separated by ``;``, for instance
+    ``poll_messages;message_handler;flatten``. Callback time is attributed to the
+    subscription that ran it, as ``...;callback;<address or hash>``. When disabled, the only
+    cost on the hot path is a check of ``enabled``.
+
+    Profiling can be started and stopped from any thread, or from a signal with
+    ``install_signal_handler``. Once the window elapses, the report is written to ``path``
+    in the chosen format, or logged if there is no path, and profiling stops. When the
+    window elapses in a trio event loop, the report is written from a worker thread so that
+    the loop does not block on the file.
+
+    Attributes:
+        enabled: Whether stages are being timed.
+        last_report: The JSON report of the most recent profiling window.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.last_report = None
+        self.window = PROFILE_WINDOW
+        self.path = None
+        self.report_format = "collapsed"
+        self._stats = {}
+        self._started_at = 0.0
+        self._deadline = None
+
+    def start(
+        self,
+        window: float = PROFILE_WINDOW,
+        path: str = None,
+        report_format: str = "collapsed",
+    ):
+        """Starts timing stages, discarding any previous measurements.
+
+        Args:
+            window: The number of seconds after which profiling stops and the report is
+            written. Profiling runs until ``stop`` if None.
+            path: The file the report is written to. The report is logged if None.
+            report_format: ``collapsed`` for flamegraph-compatible collapsed stacks, in
+            microseconds, or ``json``.
+
+        Raises:
+            ValueError: If the format is not supported.
+        """
+        if report_format not in FORMATS:
+            raise ValueError(
+                f"Unsupported report format {report_format!r}, expected one of {FORMATS}"
+            )
+        self.window = window
+        self.path = path
+        self.report_format = report_format
+        self._stats = {}
+        self._started_at = time.monotonic()
+        self._deadline = None if window is None else self._started_at + window
+        self.enabled = True
+
+    def stop(self) -> dict:
+        """Stops timing stages and writes the report.
+
+        Returns:
+            The JSON report, or None if profiling was not enabled.
+        """
+        if not self.enabled:
+            return None
+        self._write(self._finish())
+        return self.last_report
+
+    def toggle(self):
+        """Starts profiling with the last used settings if it is stopped, stops it otherwise."""
+        if self.enabled:
+            self.stop()
+        else:
+            self.start(self.window, self.path, self.report_format)
+
+    def install_signal_handler(self, signum: int = None):
+        """Toggles profiling whenever the process receives ``signum``.
+
+        Must be called from the main thread.
+
+        Args:
+            signum: The signal to handle. Defaults to ``SIGUSR1``.
+
+        Raises:
+            ValueError: If no signal is given and ``SIGUSR1`` does not exist on this
+            platform, as on Windows.
+        """
+        if signum is None:
+            signum = getattr(signal, "SIGUSR1", None)
+            if signum is None:
+                raise ValueError(
+                    "SIGUSR1 is not available on this platform, pass the signal to handle"
+                )
+        signal.signal(signum, lambda *_: self.toggle())
+
+    def record(self, stack: str, elapsed: float):
+        """Records that a stage took ``elapsed`` seconds."""
+        stats = self._stats.get(stack)
+        if stats is None:
+            stats = self._stats[stack] = [0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += elapsed
+        if elapsed > stats[2]:
+            stats[2] = elapsed
+        if self._deadline is not None and time.monotonic() >= self._deadline:
+            self._stop_in_background()
+
+    def _stop_in_background(self):
+        """Stops timing stages and writes the report from a worker thread if called from a
+        trio event loop, or in the calling thread otherwise."""
+        if not self.enabled:
+            return
+        output = self._finish()
+        try:
+            trio.lowlevel.spawn_system_task(self._write_in_thread, output)
+        except RuntimeError:
+            self._write(output)
+
+    def _finish(self) -> str:
+        """Stops timing stages and returns the formatted report."""
+        self.enabled = False
+        self.last_report = self.report()
+        if self.report_format == "json":
+            return json.dumps(self.last_report, indent=2)
+        return self.collapsed()
+
+    async def _write_in_thread(self, output: str):
+        try:
+            # Also write the report if the loop is shutting down
+            with trio.CancelScope(shield=True):
+                await trio.to_thread.run_sync(self._write, output)
+        except OSError:
+            logger.exception("Could not write the stream profile to %s", self.path)
+
+    def _write(self, output: str):
+        if self.path is None:
+            logger.info("Stream profile:\n%s", output)
+        else:
+            with open(self.path, "w") as profile_file:
+                profile_file.write(output)
+
+    def lap(self, stack: str, start: float) -> float:
+        """Records the time elapsed since ``start`` for a stage.
+
+        Returns:
+            The current ``time.perf_counter()``, to be used as the start of the next stage.
+        """
+        now = time.perf_counter()
+        self.record(stack, now - start)
+        return now
+
+    def report(self) -> dict:
+        """Returns the measurements of the current window.
+
+        Stage times are inclusive of their child stages; ``self`` excludes them.
+        """
+        stats = dict(list(self._stats.items()))
+        children = {}
+        for stack, (_, total, _) in stats.items():
+            # Attribute the time to the closest recorded ancestor
+            parent = stack.rpartition(";")[0]
+            while parent and parent not in stats:
+                parent = parent.rpartition(";")[0]
+            children[parent] = children.get(parent, 0.0) + total
+
+        stages = {}
+        callbacks = {}
+        for stack, (count, total, longest) in sorted(stats.items()):
+            stages[stack] = {
+                "count": count,
+                "total": total,
+                "self": max(0.0, total - children.get(stack, 0.0)),
+                "mean": total / count,
+                "max": longest,
+            }
+            frames = stack.split(";")
+            if len(frames) > 1 and frames[-2] == "callback":
+                callbacks[frames[-1]] = stages[stack]
+        return {
+            "window": time.monotonic() - self._started_at,
+            "stages": stages,
+            "callbacks": callbacks,
+        }
+
+    def collapsed(self) -> str:
+        """Returns the report as collapsed stacks, one ``stack microseconds`` line per stage,
+        suitable for ``flamegraph.pl``."""
+        stages = self.report()["stages"]
+        return "".join(
+            f"{stack} {round(stage['self'] * 1e6)}\n" for stack, stage in stages.items()
+        )
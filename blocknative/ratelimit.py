@@ -0,0 +1,58 @@
+"""Adaptive send-rate control for outbound websocket messages.
+"""
+import time
+from dataclasses import dataclass
+
+MIN_SEND_RATE = 1.0  # messages per second
+MAX_SEND_RATE = 200.0  # messages per second
+RATE_INCREASE = 1.0  # messages per second, per second of successful sends
+RATE_DECREASE_FACTOR = 0.5
+BACKOFF_COOLDOWN = 1.0  # seconds
+
+
+@dataclass
+class AIMDRateController:
+    """Additive-increase / multiplicative-decrease controller for the outbound message rate.
+
+    Every successful send nudges the rate up so that, at full utilisation, it grows by
+    ``increase`` messages per second each second. A ``ratelimit`` error from the server
+    multiplies the rate by ``decrease_factor``. Rejections that arrive within ``cooldown``
+    seconds of the last backoff belong to the same burst and are not counted twice.
+
+    Attributes:
+        rate: The current send rate in messages per second.
+        min_rate: The rate will never be decreased below this value.
+        max_rate: The rate will never be increased above this value.
+        increase: The additive increase applied per second of successful sends.
+        decrease_factor: The multiplicative decrease applied on a rate limit error.
+        cooldown: The number of seconds during which further rate limit errors are ignored.
+        backoffs: The number of times the rate has been decreased.
+    """
+
+    rate: float
+    min_rate: float = MIN_SEND_RATE
+    max_rate: float = MAX_SEND_RATE
+    increase: float = RATE_INCREASE
+    decrease_factor: float = RATE_DECREASE_FACTOR
+    cooldown: float = BACKOFF_COOLDOWN
+    backoffs: int = 0
+    _last_backoff: float = None
+
+    @property
+    def interval(self) -> float:
+        """The number of seconds to wait between two sends at the current rate."""
+        return 1 / self.rate
+
+    def on_success(self):
+        """Records a successful send and probes the rate upward."""
+        self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def on_rate_limit(self):
+        """Records a rate limit error from the server and backs the rate off."""
+        now = time.monotonic()
+        if self._last_backoff is not None and now - self._last_backoff < self.cooldown:
+            return
+
+        self._last_backoff = now
+        self.backoffs += 1
+        self.rate = max(self.min_rate, self.rate * self.decrease_factor)
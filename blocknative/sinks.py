@@ -0,0 +1,237 @@
+"""
+Sinks which persist transactions delivered by a stream.
+"""
+import json
+import sqlite3
+import threading
+import time
+from queue import Queue, Empty, Full
+from typing import Callable, List
+import trio
+
+SINK_BATCH_SIZE = 500
+SINK_FLUSH_INTERVAL = 1.0  # seconds
+SINK_MAX_PENDING = 10_000
+SINK_RETRY_INTERVAL = 0.1  # seconds between checks for a failed worker while waiting for room
+
+# Flattened transaction fields and their SQLite column types
+TRANSACTION_COLUMNS = {
+    "hash": "TEXT",
+    "eventCode": "TEXT",
+    "status": "TEXT",
+    "timeStamp": "TEXT",
+    "system": "TEXT",
+    "network": "TEXT",
+    "watchedAddress": "TEXT",
+    "direction": "TEXT",
+    "counterparty": "TEXT",
+    "from": "TEXT",
+    "to": "TEXT",
+    "value": "TEXT",
+    "gas": "INTEGER",
+    "gasPrice": "TEXT",
+    "gasPriceGwei": "INTEGER",
+    "gasUsed": "TEXT",
+    "maxFeePerGas": "TEXT",
+    "maxPriorityFeePerGas": "TEXT",
+    "baseFeePerGas": "TEXT",
+    "nonce": "INTEGER",
+    "type": "INTEGER",
+    "blockHash": "TEXT",
+    "blockNumber": "INTEGER",
+    "pendingBlockNumber": "INTEGER",
+    "transactionIndex": "INTEGER",
+    "input": "TEXT",
+    "asset": "TEXT",
+    "contractCall": "TEXT",
+}
+
+_CLOSE = object()
+
+
+class SQLiteSink:
+    """Persists flattened transactions into a SQLite table in bulk.
+
+    Transactions are buffered and written by a worker thread with ``executemany``, one
+    database transaction per batch. A batch is flushed once it holds ``batch_size`` rows or
+    ``flush_interval`` seconds after its first row, whichever comes first. The database is
+    opened in WAL mode. At most ``max_pending`` rows are buffered: when the disk falls behind
+    the sink's callback waits for room, without blocking the event loop.
+
+    If writing fails, the worker stops and the error is raised by the next call to the
+    sink and by ``close``.
+
+    An instance can be passed directly as a subscription callback.
+
+    Args:
+        path: The path of the SQLite database file.
+        table: The name of the table to write to. Created if it does not exist.
+        columns: The transaction fields to store. Defaults to every field in ``TRANSACTION_COLUMNS``.
+        Nested values such as ``contractCall`` are stored as JSON.
+        batch_size: The number of rows written per database transaction.
+        flush_interval: The maximum number of seconds a row is buffered before being written.
+        max_pending: The maximum number of rows buffered in memory.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        table: str = "transactions",
+        columns: List[str] = None,
+        batch_size: int = SINK_BATCH_SIZE,
+        flush_interval: float = SINK_FLUSH_INTERVAL,
+        max_pending: int = SINK_MAX_PENDING,
+    ):
+        self.path = path
+        self.table = table
+        self.columns = list(columns or TRANSACTION_COLUMNS)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self.flushes = 0
+        self._queue = Queue(max_pending)
+        self._ready = threading.Event()
+        self._error = None
+        self._worker = threading.Thread(target=self._run, name="SQLiteSink", daemon=True)
+        self._worker.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    async def __call__(self, transaction: dict, unsubscribe: Callable = None):
+        """Buffers a transaction to be written.
+
+        Args:
+            transaction: The flattened transaction.
+            unsubscribe: Unused. Accepted so the sink can be used as a subscription callback.
+
+        Raises:
+            sqlite3.Error: If the worker thread failed to write rows.
+        """
+        row = self._project(transaction)
+        if self._error is not None:
+            raise self._error
+        try:
+            self._queue.put_nowait(row)
+            return
+        except Full:
+            pass
+
+        # Wait for room in a thread, whose blocking put wakes up as soon as the worker takes
+        # a row. If the caller is cancelled, the thread gives up without buffering the row.
+        cancelled = threading.Event()
+        try:
+            await trio.to_thread.run_sync(
+                self._put_when_room, row, cancelled, cancellable=True
+            )
+        finally:
+            cancelled.set()
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        """Writes the buffered rows and stops the worker thread.
+
+        Raises:
+            sqlite3.Error: If the worker thread failed to write rows.
+        """
+        while self._worker.is_alive():
+            try:
+                self._queue.put(_CLOSE, timeout=SINK_RETRY_INTERVAL)
+                break
+            except Full:
+                continue
+        self._worker.join()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _put_when_room(self, row: tuple, cancelled: threading.Event):
+        """Buffers a row once there is room, unless the worker fails or the caller gives up."""
+        while self._error is None and not cancelled.is_set():
+            try:
+                self._queue.put(row, timeout=SINK_RETRY_INTERVAL)
+                return
+            except Full:
+                continue
+
+    def _project(self, transaction: dict) -> tuple:
+        """Converts a transaction into a row holding the configured columns."""
+        row = []
+        for column in self.columns:
+            value = transaction.get(column)
+            if isinstance(value, (dict, list)):
+                value = json.dumps(value)
+            row.append(value)
+        return tuple(row)
+
+    def _run(self):
+        """Worker thread: Collects buffered rows into batches and writes them."""
+        try:
+            connection = self._open()
+        except sqlite3.Error as error:
+            self._error = error
+            self._ready.set()
+            return
+        self._ready.set()
+
+        try:
+            self._write_batches(connection)
+        except Exception as error:  # pylint: disable=broad-except
+            self._error = error
+        finally:
+            connection.close()
+
+    def _write_batches(self, connection: sqlite3.Connection):
+        """Writes the buffered rows in batches until the sink is closed."""
+        columns = ", ".join(f'"{column}"' for column in self.columns)
+        placeholders = ", ".join("?" for _ in self.columns)
+        insert = f'INSERT INTO "{self.table}" ({columns}) VALUES ({placeholders})'
+
+        batch = []
+        deadline = None
+        closing = False
+        while not closing:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                row = self._queue.get(timeout=timeout)
+                # Drain whatever else is already buffered without waiting
+                while row is not _CLOSE:
+                    batch.append(row)
+                    if len(batch) >= self.batch_size:
+                        break
+                    row = self._queue.get_nowait()
+                closing = row is _CLOSE
+            except Empty:
+                pass
+
+            if batch and deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+            if batch and (
+                closing
+                or len(batch) >= self.batch_size
+                or time.monotonic() >= deadline
+            ):
+                with connection:
+                    connection.executemany(insert, batch)
+                self.rows_written += len(batch)
+                self.flushes += 1
+                batch = []
+                deadline = None
+
+    def _open(self) -> sqlite3.Connection:
+        """Opens the database in WAL mode and creates the table."""
+        connection = sqlite3.connect(self.path)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        definitions = ", ".join(
+            f'"{column}" {TRANSACTION_COLUMNS.get(column, "")}'.rstrip()
+            for column in self.columns
+        )
+        connection.execute(f'CREATE TABLE IF NOT EXISTS "{self.table}" ({definitions})')
+        return connection
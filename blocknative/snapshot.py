@@ -0,0 +1,155 @@
+"""Subscription snapshots and pre-encoded subscription messages.
+"""
+import json
+import os
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional, Tuple
+from blocknative.abi import Abi, abi_store
+
+SNAPSHOT_VERSION = 1
+TIMESTAMP_PLACEHOLDER = "__bn_timestamp__"
+_CONFIG_PLACEHOLDER = "__bn_config__"
+
+
+class PreparedMessage:
+    """A JSON encoded message whose timestamp is filled in when it is sent.
+
+    The message is kept as the encoded text before and after the timestamp value, so
+    stamping it only joins three strings.
+    """
+
+    __slots__ = ("_head", "_tail")
+
+    def __init__(self, head: str, tail: str):
+        self._head = head
+        self._tail = tail
+
+    def stamp(self) -> str:
+        """Returns the encoded message, timestamped now."""
+        return f'{self._head}"{datetime.now().isoformat()}"{self._tail}'
+
+
+class ConfigEncoder:
+    """Encodes the ``configs`` put messages of a stream.
+
+    The envelope shared by every message (api key, version, network, ...) is encoded once,
+    so encoding a message only encodes its config. The output matches what
+    ``Stream._send_config_message`` sends.
+
+    Args:
+        envelope: A payload built by ``Stream._build_payload`` for ``configs`` put messages,
+        without config.
+    """
+
+    def __init__(self, envelope: dict):
+        envelope = {
+            **envelope,
+            "timeStamp": TIMESTAMP_PLACEHOLDER,
+            "config": _CONFIG_PLACEHOLDER,
+        }
+        encoded = json.dumps(envelope)
+        head, self._tail = encoded.split(f'"{_CONFIG_PLACEHOLDER}"', 1)
+        self._head, self._middle = head.split(f'"{TIMESTAMP_PLACEHOLDER}"', 1)
+
+    def encode(
+        self, scope: str, filters: List[dict] = None, abi: Abi = None
+    ) -> PreparedMessage:
+        """Encodes the message which watches ``scope`` with the given filters and ABI."""
+        config = {"scope": scope}
+        if filters is not None:
+            config["filters"] = filters
+        if abi is not None:
+            config["abi"] = abi.placeholder
+        config["watchAddress"] = True
+        body = json.dumps(config)
+        if abi is not None:
+            body = body.replace(f'"{abi.placeholder}"', abi.encoded, 1)
+        return PreparedMessage(self._head, f"{self._middle}{body}{self._tail}")
+
+
+@dataclass
+class Snapshot:
+    """Dataclass representing the subscriptions saved in a snapshot file.
+
+    Attributes:
+        blockchain: The blockchain of the stream the snapshot was taken from.
+        network_id: The id of the network of the stream the snapshot was taken from.
+        addresses: The address subscriptions, as (address, filters, abi) tuples.
+        transactions: The transaction subscriptions, as (hash, status) tuples.
+    """
+
+    blockchain: str
+    network_id: int
+    addresses: List[Tuple[str, Optional[List[dict]], Optional[Abi]]] = field(
+        default_factory=list
+    )
+    transactions: List[Tuple[str, str]] = field(default_factory=list)
+
+
+def write_snapshot(path: str, snapshot: Snapshot):
+    """Writes a snapshot to a file, replacing it atomically.
+
+    Each distinct ABI is written once and referenced by its digest.
+
+    Args:
+        path: The path of the snapshot file.
+        snapshot: The subscriptions to save.
+    """
+    abis = {}
+    addresses = []
+    for address, filters, abi in snapshot.addresses:
+        digest = None
+        if abi is not None:
+            digest = abi.digest
+            abis[digest] = abi
+        addresses.append([address, filters, digest])
+
+    # ABIs are written as their cached encoding, spliced in after encoding the rest
+    document = {
+        "version": SNAPSHOT_VERSION,
+        "blockchain": snapshot.blockchain,
+        "networkId": snapshot.network_id,
+        "abis": {digest: abi.placeholder for digest, abi in abis.items()},
+        "addresses": addresses,
+        "transactions": [list(transaction) for transaction in snapshot.transactions],
+    }
+    encoded = json.dumps(document, separators=(",", ":"))
+    for abi in abis.values():
+        encoded = encoded.replace(f'"{abi.placeholder}"', abi.encoded, 1)
+
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as snapshot_file:
+        snapshot_file.write(encoded)
+    os.replace(temporary, path)
+
+
+def read_snapshot(path: str) -> Snapshot:
+    """Reads a snapshot file. ABIs are interned in ``abi_store``.
+
+    Args:
+        path: The path of the snapshot file.
+
+    Returns:
+        The saved subscriptions.
+
+    Raises:
+        ValueError: If the file is not a snapshot of a supported version.
+    """
+    with open(path) as snapshot_file:
+        document = json.load(snapshot_file)
+    if not isinstance(document, dict) or document.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"{path} is not a version {SNAPSHOT_VERSION} snapshot")
+
+    abis = {
+        digest: abi_store.intern(entries) for digest, entries in document["abis"].items()
+    }
+    return Snapshot(
+        document["blockchain"],
+        document["networkId"],
+        [
+            (address, filters, abis[digest] if digest else None)
+            for address, filters, digest in document["addresses"]
+        ],
+        [(tx_hash, status) for tx_hash, status in document["transactions"]],
+    )
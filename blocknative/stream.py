@@ -1,20 +1,39 @@
 """
 Blocknative Stream.
 """
+import heapq
+import itertools
 import json
+import threading
+from collections import OrderedDict, deque
 from datetime import datetime
 import time
 from dataclasses import dataclass, field
 from queue import Queue, Empty
-from typing import List, Mapping, Callable, Union
+from typing import TYPE_CHECKING, Dict, Iterable, List, Mapping, Callable, Tuple, Union
 import trio
 import logging
-from logging import INFO
-from trio_websocket import (
-    open_websocket_url,
-    ConnectionClosed,
-    HandshakeError,
-    WebSocketConnection,
+from blocknative.abi import Abi, abi_store
+from blocknative.confirmations import ConfirmationScheduler
+from blocknative.control import StreamController
+from blocknative.connection import (
+    open_websocket,
+    Compression,
+    Connector,
+    TransportStats,
+)
+from blocknative.exceptions import WebsocketRateLimitError
+from blocknative.health import ConnectionHealth
+from blocknative.hedge import FirstArrivalFilter, HedgeStats
+from blocknative.profiling import Profiler
+from blocknative.ratelimit import AIMDRateController
+from blocknative.tracing import RateLimitedLog, TrafficTrace
+from blocknative.snapshot import (
+    ConfigEncoder,
+    PreparedMessage,
+    Snapshot,
+    read_snapshot,
+    write_snapshot,
 )
 from blocknative.utils import (
     raise_error_on_status,
@@ -28,12 +47,19 @@ from blocknative.utils import (
 
 from blocknative import __version__ as API_VERSION
 
-FORMAT = "%(asctime)s [%(levelname)s]: %(message)s"
-logging.basicConfig(format=FORMAT, level=INFO)
+if TYPE_CHECKING:
+    from trio_websocket import WebSocketConnection
+
+logger = logging.getLogger(__name__)
+_rate_limit_log = RateLimitedLog(logger)
+_traffic = TrafficTrace(logger)
 
 PING_INTERVAL = 15
 PING_TIMEOUT = 10
 MESSAGE_SEND_INTERVAL = 0.021  # 21ms
+SUBSCRIPTION_EXPIRY_INTERVAL = 1  # seconds
+TERMINAL_TXN_STATUSES = {"confirmed", "failed", "dropped"}
+TOMBSTONE_CAPACITY = 10_000  # unsubscribed addresses whose late events are dropped
 
 BN_BASE_URL = "wss://api.blocknative.com/v0"
 BN_ETHEREUM = "ethereum"
@@ -42,6 +68,8 @@ BN_STREAM_CLASS_VERSION = "1.1"
 
 Callback = Callable[[dict, Callable], None]
 
+_UNCHANGED = object()
+
 
 @dataclass
 class Subscription:
@@ -51,11 +79,49 @@ class Subscription:
         callback: Callback function that will get executed for this subscription.
         data: Data associated with a subscription.
         sub_type: The type of subscription - `ADDRESS` or `TRANSACTION`.
+        batch: How transactions are batched before being delivered, if at all.
+        payload: The pre-encoded message which watches the address, once encoded.
     """
 
     callback: Callback
     data: dict
     sub_type: SubscriptionType
+    batch: "BatchPolicy" = None
+    payload: PreparedMessage = None
+
+
+@dataclass
+class BatchPolicy:
+    """Dataclass representing how transactions are batched before being delivered.
+
+    A batch is delivered once it holds ``max_items`` transactions, once no more messages
+    are already buffered on the connection, or once its first transaction has waited
+    ``max_latency_ms`` milliseconds while messages kept arriving, whichever comes first.
+
+    Attributes:
+        max_items: The maximum number of transactions in a batch.
+        max_latency_ms: The maximum number of milliseconds a transaction is held back.
+    """
+
+    max_items: int = 100
+    max_latency_ms: float = 10
+
+
+@dataclass
+class SubscriptionCounts:
+    """Dataclass representing the number of subscriptions held by a stream.
+
+    Attributes:
+        addresses: The number of active address subscriptions.
+        transactions: The number of active transaction subscriptions.
+        retired: The number of transaction subscriptions removed after reaching a terminal status.
+        expired: The number of transaction subscriptions removed after their TTL elapsed.
+    """
+
+    addresses: int = 0
+    transactions: int = 0
+    retired: int = 0
+    expired: int = 0
 
 
 @dataclass
@@ -92,6 +158,22 @@ class Config:
         }
 
 
+def _raw_watched_address(message: str) -> str:
+    """Extracts the first ``watchedAddress`` value from an encoded message without decoding it.
+
+    Returns:
+        The watched address, or None if the message has none.
+    """
+    start = message.find('"watchedAddress"')
+    if start < 0:
+        return None
+    start = message.find('"', start + len('"watchedAddress"'))
+    end = message.find('"', start + 1)
+    if start < 0 or end < 0:
+        return None
+    return message[start + 1 : end]
+
+
 class Stream:
     """Stream class used to connect to Blocknative's WebSocket API.
 
@@ -101,6 +183,17 @@ class Stream:
         blockchain: The blockchain you want to connect to. Default is ``ethereum``.
         network_id: The id of the network. For instance, ``4`` for Ethereum Rinkeby.
         global_filters: The filters that will be applied globally to the stream.
+        send_rate: The controller used to adapt the outbound message rate. The learned rate
+        is kept across reconnects. Defaults to one message every ``MESSAGE_SEND_INTERVAL``.
+        compression: The permessage-deflate settings to offer to the server. Compression is
+        disabled by default.
+        connector: Opens the connections, reusing TLS sessions and resolved addresses
+        across reconnects. Its ``timings`` hold the handshake timings of the last connection.
+        Pass ``Connector(prewarm=True)`` to keep a standby connection ready for reconnects.
+
+    Note:
+        Use ``stream.control`` to subscribe or unsubscribe from another thread while
+        ``connect()`` is running. See :class:`blocknative.control.StreamController`.
     """
 
     api_key: str
@@ -109,9 +202,26 @@ class Stream:
     version: str = BN_STREAM_CLASS_VERSION
     global_filters: List[dict] = None
     valid_session: bool = True
-    _ws: WebSocketConnection = None
+    _ws: "WebSocketConnection" = None
     _message_queue: Queue = Queue()
     _subscription_registry: Mapping[str, Subscription] = {}
+    compression: Compression = None
+    transport_stats: TransportStats = None
+    connector: Connector = None
+    _send_rate: AIMDRateController = None
+    _retry_queue: deque = None
+    _confirmations: ConfirmationScheduler = None
+    subscription_counts: SubscriptionCounts = None
+    _expiry_heap: list = None
+    health: ConnectionHealth = None
+    hedge_stats: HedgeStats = None
+    _legs: list = None
+    _pending_batches: Dict[str, Tuple[float, List[dict]]] = None
+    _tombstones: OrderedDict = None
+    control: StreamController = None
+    _trio_token: trio.lowlevel.TrioToken = None
+    _config_encoder: ConfigEncoder = None
+    profiler: Profiler = None
 
     def __init__(
         self,
@@ -119,18 +229,46 @@ class Stream:
         blockchain: str = BN_ETHEREUM,
         network_id: int = BN_ETHEREUM_ID,
         global_filters: List[dict] = global_filters,
+        send_rate: AIMDRateController = None,
+        compression: Compression = None,
+        connector: Connector = None,
     ):
         self.api_key = api_key
         self.blockchain = blockchain
         self.network_id = network_id
         self.global_filters = global_filters
+        self._message_queue = Queue()
+        self._subscription_registry = {}
+        self._send_rate = send_rate or AIMDRateController(1 / MESSAGE_SEND_INTERVAL)
+        self._retry_queue = deque()
+        self.compression = compression
+        self.transport_stats = TransportStats()
+        self.connector = connector or Connector()
+        self._confirmations = ConfirmationScheduler()
+        self.subscription_counts = SubscriptionCounts()
+        self._expiry_heap = []
+        self._expiry_counter = itertools.count()
+        self.health = ConnectionHealth(
+            max_interval=PING_INTERVAL, max_timeout=PING_TIMEOUT
+        )
+        self.hedge_stats = HedgeStats()
+        self._first_arrivals = FirstArrivalFilter(self.hedge_stats)
+        self._legs = []
+        self._pending_batches = {}
+        self._tombstones = OrderedDict()
+        self._registry_lock = threading.RLock()
+        self._dispatcher_wakeup = trio.Event()
+        self._loop_thread = None
+        self.control = StreamController(self)
+        self.profiler = Profiler()
 
     def subscribe_address(
         self,
         address: str,
         callback: Callback,
         filters: List[dict] = None,
-        abi: Union[List[dict], str] = None,
+        abi: Union[Abi, List[dict], str] = None,
+        batch: BatchPolicy = None,
     ):
         """Subscribes to an address to listen to any incoming and
         outgoing transactions that occur on that address.
@@ -139,83 +277,248 @@ class Stream:
             address: The address to watch for incoming and outgoing transactions.
             callback: The callback function that will get executed for this subscription.
             filters: The filters by which to filter the transactions associated with the address.
-            abi: The ABI of the contract. Used if `address` is a contract address.
+            abi: The ABI of the contract. Used if `address` is a contract address. ABIs are
+            interned, so subscriptions sharing an ABI share a single parsed copy.
+            batch: If set, the callback receives lists of transactions, batched according
+            to this policy, instead of one transaction at a time.
         """
 
         if self.blockchain == BN_ETHEREUM:
             address = address.lower()
 
-        if isinstance(abi, str):
-            abi = json.loads(abi)
+        abi = abi_store.intern(abi)
 
         # Add this subscription to the registry
-        self._subscription_registry[address] = Subscription(
+        subscription = Subscription(
             callback,
             {"filters": filters, "abi": abi},
             SubscriptionType.ADDRESS,
+            batch,
         )
+        self._add_subscription(address, subscription)
 
         # Only send the message if we are already connected. The connection handler
         # will send the messages within the registry upon connect.
         if self._is_connected():
-            self._send_config_message(address, True, filters)
+            self.send_message(self._prepare_config_message(address, subscription))
 
-    def subscribe_txn(self, tx_hash: str, callback: Callback, status: str = "sent"):
+    def subscribe_txn(
+        self,
+        tx_hash: str,
+        callback: Callback,
+        status: str = "sent",
+        ttl: float = None,
+    ):
         """Subscribes to an transaction to listen to transaction state changes.
 
+        The subscription is removed once the transaction is confirmed, failed or dropped.
+
         Args:
             txn_hash: The hash of the transaction to watch.
             callback: The callback function that will get executed for this subscription.
             status: The status of the transaction to receive events for. Leave out for all events.
+            ttl: The number of seconds after which to unwatch the transaction if it has not
+            reached a terminal status. Never expires by default.
         """
         # Add this subscription to the registry
-        self._subscription_registry[tx_hash] = Subscription(
-            callback, status, SubscriptionType.TRANSACTION
-        )
+        subscription = Subscription(callback, status, SubscriptionType.TRANSACTION)
+        self._add_subscription(tx_hash, subscription)
+        if ttl is not None:
+            with self._registry_lock:
+                heapq.heappush(
+                    self._expiry_heap,
+                    (
+                        time.monotonic() + ttl,
+                        next(self._expiry_counter),
+                        tx_hash,
+                        subscription,
+                    ),
+                )
 
         # Only send the message if we are already connected. The connection handler
         # will send the messages within the registry upon connect.
         if self._is_connected():
             self._send_txn_watch_message(tx_hash, status)
 
-    def connect(self, base_url: str = BN_BASE_URL):
+    async def wait_confirmations(self, tx_hash: str, confirmations: int = 1) -> int:
+        """Waits until a transaction has reached a number of confirmations.
+
+        Confirmations are counted from the block numbers observed on incoming events, so
+        the wait only makes progress while the stream receives events. Subscribes to the
+        transaction if it is not already subscribed. Must be awaited from within the
+        stream's event loop, for instance in a callback.
+
+        Args:
+            tx_hash: The hash of the transaction to wait for.
+            confirmations: The number of confirmations to wait for. The block including the
+            transaction counts as the first confirmation.
+
+        Returns:
+            The block number at which the transaction reached ``confirmations`` confirmations.
+
+        Raises:
+            TransactionDroppedError: If the transaction is dropped before being confirmed.
+        """
+        waiter = self._watch_confirmations(tx_hash, confirmations)
+        return await waiter.wait()
+
+    async def wait_confirmations_many(
+        self, tx_hashes: List[str], confirmations: int = 1
+    ) -> Mapping[str, int]:
+        """Waits until every transaction has reached a number of confirmations.
+
+        Args:
+            tx_hashes: The hashes of the transactions to wait for.
+            confirmations: The number of confirmations to wait for.
+
+        Returns:
+            The block number at which each transaction reached ``confirmations`` confirmations.
+
+        Raises:
+            TransactionDroppedError: If a transaction is dropped before being confirmed.
+        """
+        waiters = [
+            self._watch_confirmations(tx_hash, confirmations) for tx_hash in tx_hashes
+        ]
+        try:
+            return {waiter.tx_hash: await waiter.wait() for waiter in waiters}
+        finally:
+            # Waits not reached yet are abandoned if this one is cancelled or fails
+            for waiter in waiters:
+                waiter.discard()
+
+    def _watch_confirmations(self, tx_hash: str, confirmations: int):
+        """Registers a confirmation wait, subscribing to the transaction if needed.
+
+        The subscription is kept until every wait on the transaction is resolved, so that
+        its events keep advancing the chain head.
+        """
+        waiter = self._confirmations.watch(tx_hash, confirmations)
+        if not waiter.event.is_set() and tx_hash not in self._subscription_registry:
+
+            async def ignore(transaction):
+                pass
+
+            self.subscribe_txn(tx_hash, ignore)
+        return waiter
+
+    def connect(self, base_url: str = BN_BASE_URL, hedge_url: str = None):
         """Initializes the connection to the WebSocket server.
 
+        If ``hedge_url`` is given, a second connection with the same subscriptions is kept
+        open to it. Each event is delivered from whichever connection receives it first and
+        its copy from the other connection is dropped. ``hedge_stats`` reports which
+        connection won and by how much.
+
         Args:
             base_url: The websocket url to connect to. Useful for when using a proxy.
+            hedge_url: The websocket url of the second connection. May be the same as ``base_url``.
         """
         try:
-            return trio.run(self._connect, base_url)
+            return trio.run(self._run, base_url, hedge_url)
         except KeyboardInterrupt:
             print("keyboard interrupt")
             return None
 
-    def send_message(self, message: str):
+    async def _run(self, base_url: str, hedge_url: str = None):
+        """Runs the connection, or the hedged connections, then closes the connector."""
+        try:
+            if hedge_url is not None:
+                return await self._connect_hedged(base_url, hedge_url)
+            return await self._connect(base_url)
+        finally:
+            await self.connector.aclose()
+
+    def send_message(self, message: Union[dict, str]):
         """Sends a websocket message. (Adds the message to the queue to be sent).
 
         Args:
-            message: The message to send.
+            message: The message to send, either as a payload or already JSON encoded.
         """
+        if self._legs:
+            # Hedged: send on every open connection. Closed ones replay on reconnect.
+            legs = [leg for leg in self._legs if leg._is_connected()] or self._legs
+            for leg in legs:
+                leg.send_message(message)
+            return
+
         self._message_queue.put(message)
-        logging.debug("Sending: %s", message)
+        self._wake_dispatcher()
+
+    def _send_messages(self, messages: List[Union[dict, str]]):
+        """Queues several messages to be sent, waking the dispatcher only once."""
+        if self._legs:
+            for message in messages:
+                self.send_message(message)
+            return
+
+        for message in messages:
+            self._message_queue.put(message)
+        self._wake_dispatcher()
+
+    def _wake_dispatcher(self):
+        """Wakes the idle message dispatcher up, from any thread."""
+        if self._trio_token is None:
+            return
+        if self._in_loop_thread():
+            self._dispatcher_wakeup.set()
+            return
+        try:
+            self._trio_token.run_sync_soon(lambda: self._dispatcher_wakeup.set())
+        except trio.RunFinishedError:
+            pass
+
+    def _attach_loop(self):
+        """Records the trio event loop the stream runs in, so other threads can reach it."""
+        self._trio_token = trio.lowlevel.current_trio_token()
+        self._loop_thread = threading.get_ident()
+
+    def _in_loop_thread(self) -> bool:
+        """Tests whether the caller runs in the thread of the stream's event loop."""
+        return self._loop_thread == threading.get_ident()
 
     async def _message_dispatcher(self):
-        """In a loop: Polls send message queue for latest messages to send to server.
+        """In a loop: Sends the queued messages to the server.
 
-        Waits ``MESSAGE_SEND_INTERVAL`` seconds before sending the next message
-        in order to comply with the server's limit of 50 messages per second
+        Messages rejected by the server's rate limit are retried before any newly queued
+        message. Waits for the interval given by the adaptive send rate before sending the
+        next message in order to comply with the server's message rate limit. When both
+        queues are empty, sleeps until ``send_message`` wakes it up.
 
         Note:
             This function runs until cancelled.
         """
         while self.valid_session:
+            if not self._retry_queue and self._message_queue.empty():
+                self._dispatcher_wakeup = trio.Event()
+                # Check again now that the wakeup is armed, in case another thread
+                # queued a message in between
+                if not self._retry_queue and self._message_queue.empty():
+                    await self._dispatcher_wakeup.wait()
+                continue
             try:
-                msg = self._message_queue.get_nowait()
-                await self._ws.send_message(json.dumps(msg))
+                if self._retry_queue:
+                    msg = self._retry_queue.popleft()
+                else:
+                    msg = self._message_queue.get_nowait()
+                profiler = self.profiler if self.profiler.enabled else None
+                if profiler:
+                    start = time.perf_counter()
+                if isinstance(msg, PreparedMessage):
+                    msg = msg.stamp()
+                elif not isinstance(msg, str):
+                    msg = json.dumps(msg)
+                if profiler:
+                    start = profiler.lap("message_dispatcher;encode", start)
+                await self._ws.send_message(msg)
+                if profiler:
+                    profiler.lap("message_dispatcher;send", start)
+                _traffic.sent(msg)
+                self._send_rate.on_success()
             except Empty:
                 pass
             finally:
-                await trio.sleep(MESSAGE_SEND_INTERVAL)
+                await trio.sleep(self._send_rate.interval)
 
     async def _poll_messages(self):
         """In a loop: Polls ``ws`` message queue for latest WebSocket message.
@@ -224,8 +527,36 @@ class Stream:
             This function runs until cancelled.
         """
         while self.valid_session:
+            profiler = self.profiler if self.profiler.enabled else None
+            if self._pending_batches:
+                if profiler:
+                    start = time.perf_counter()
+                # Keep batching while messages are already buffered, up to the latency cap
+                await self._flush_batches(due_only=self._has_buffered_messages())
+                if profiler:
+                    profiler.lap("poll_messages;flush_batches", start)
             msg = await self._ws.get_message()
-            await self._message_handler(json.loads(msg))
+            _traffic.received(msg)
+            if self._tombstones and _raw_watched_address(msg) in self._tombstones:
+                # Late event of an unsubscribed address, skip decoding it
+                continue
+            profiler = self.profiler if self.profiler.enabled else None
+            if profiler:
+                start = time.perf_counter()
+            message = json.loads(msg)
+            if profiler:
+                start = profiler.lap("poll_messages;decode", start)
+            await self._message_handler(message)
+            if profiler:
+                profiler.lap("poll_messages;message_handler", start)
+
+    def _has_buffered_messages(self) -> bool:
+        """Tests whether messages have been received but not read yet."""
+        channel = getattr(self._ws, "_recv_channel", None)
+        if channel is None:
+            return False
+        statistics = channel.statistics()
+        return statistics.current_buffer_used > 0 or statistics.tasks_waiting_send > 0
 
     async def _message_handler(self, message: dict):
         """Handles incoming WebSocket messages.
@@ -241,8 +572,28 @@ class Stream:
             self.valid_session = False
             return
 
+        profiler = self.profiler if self.profiler.enabled else None
+        if profiler:
+            start = time.perf_counter()
+
         # Raises an exception if the status of the message is an error
-        raise_error_on_status(message)
+        try:
+            raise_error_on_status(message)
+        except WebsocketRateLimitError:
+            # Back off and requeue the rejected message rather than dropping the connection
+            self._send_rate.on_rate_limit()
+            if "event" in message:
+                self._retry_queue.append(message["event"])
+                self._wake_dispatcher()
+            _rate_limit_log.log(
+                logging.WARNING,
+                "Rate limited by server, send rate reduced to %.1f msg/s",
+                self._send_rate.rate,
+            )
+            return
+
+        if profiler:
+            start = profiler.lap("poll_messages;message_handler;status", start)
 
         if "event" in message:
             event = message["event"]
@@ -252,15 +603,32 @@ class Stream:
 
             if "transaction" in event:
                 event_transaction = event["transaction"]
+                settled = self._confirmations.observe(event_transaction)
                 # Checks if the messsage is for a transaction subscription
                 if subscription_type(message) == SubscriptionType.TRANSACTION:
                     # Find the matching subscription and run it's callback
                     transaction_hash = event_transaction["hash"]
                     if transaction_hash in self._subscription_registry:
                         transaction = self._flatten_event_to_transaction(event)
+                        if profiler:
+                            start = profiler.lap(
+                                "poll_messages;message_handler;flatten", start
+                            )
                         await self._subscription_registry[transaction_hash].callback(
                             transaction
                         )
+                        if profiler:
+                            profiler.lap(
+                                f"poll_messages;message_handler;callback;{transaction_hash}",
+                                start,
+                            )
+                        # The server sends no further events for this transaction. It is
+                        # kept while confirmation waits on it are pending, and retired once
+                        # they are resolved.
+                        status = event_transaction.get("status")
+                        if status in TERMINAL_TXN_STATUSES:
+                            if not self._confirmations.has_waits(transaction_hash):
+                                self._retire_subscription(transaction_hash)
 
                 # Checks if the messsage is for an address subscription
                 elif subscription_type(message) == SubscriptionType.ADDRESS:
@@ -270,41 +638,304 @@ class Stream:
                         and watched_address is not None
                     ):
                         # Find the matching subscription and run it's callback
+                        subscription = self._subscription_registry[watched_address]
                         transaction = self._flatten_event_to_transaction(event)
-                        await self._subscription_registry[watched_address].callback(
-                            transaction, (lambda: self.unsubscribe(watched_address))
-                        )
+                        if profiler:
+                            start = profiler.lap(
+                                "poll_messages;message_handler;flatten", start
+                            )
+                        if subscription.batch is not None:
+                            await self._add_to_batch(
+                                watched_address, subscription.batch, transaction
+                            )
+                        else:
+                            await subscription.callback(
+                                transaction, (lambda: self.unsubscribe(watched_address))
+                            )
+                            if profiler:
+                                profiler.lap(
+                                    f"poll_messages;message_handler;callback;{watched_address}",
+                                    start,
+                                )
+
+                for tx_hash in settled:
+                    self._retire_subscription(tx_hash)
+
+    def _retire_subscription(self, tx_hash: str):
+        """Removes the subscription of a transaction that reached a terminal status."""
+        subscription = self._subscription_registry.get(tx_hash)
+        if subscription is not None and subscription.sub_type == SubscriptionType.TRANSACTION:
+            if self._remove_subscription(tx_hash):
+                self.subscription_counts.retired += 1
+
+    async def _add_to_batch(self, key: str, policy: BatchPolicy, transaction: dict):
+        """Adds a transaction to the pending batch of a subscription, delivering the batch
+        if it is full."""
+        if key not in self._pending_batches:
+            deadline = time.monotonic() + policy.max_latency_ms / 1000
+            self._pending_batches[key] = (deadline, [])
+        transactions = self._pending_batches[key][1]
+        transactions.append(transaction)
+        if len(transactions) >= policy.max_items:
+            await self._flush_batch(key, "poll_messages;message_handler")
+
+    async def _flush_batch(self, key: str, stack: str = "poll_messages;flush_batches"):
+        """Delivers the pending batch of a subscription to its callback.
 
-    def unsubscribe(self, watched_address):
+        Args:
+            key: The key of the subscription.
+            stack: The stage the callback time is attributed to when profiling.
+        """
+        _, transactions = self._pending_batches.pop(key, (None, None))
+        subscription = self._subscription_registry.get(key)
+        if transactions and subscription is not None:
+            profiler = self.profiler if self.profiler.enabled else None
+            if profiler:
+                start = time.perf_counter()
+            await subscription.callback(transactions, (lambda: self.unsubscribe(key)))
+            if profiler:
+                profiler.lap(f"{stack};callback;{key}", start)
+
+    async def _flush_batches(self, due_only: bool = False):
+        """Delivers the pending batches.
+
+        Args:
+            due_only: Only deliver the batches whose latency cap has been reached.
+        """
+        now = time.monotonic()
+        for key, (deadline, _) in list(self._pending_batches.items()):
+            if not due_only or deadline <= now:
+                await self._flush_batch(key)
+
+    def unsubscribe(self, watched_address: str):
         """Unsubscribe from the current stream.
 
+        Removes the subscription and, if connected, tells the server to stop sending its
+        events. Events for the address which are still in flight are dropped before being
+        decoded.
+
         Note:
             This function is passed as a parameter to the to the transaction callback that you provide.
 
         Args:
-            watched_address: The address to unsubscribe from.
+            watched_address: The address or transaction hash to unsubscribe from.
         """
+        self.unsubscribe_many([watched_address])
 
-        # remove this subscription from the registry so that we don't execute the callback
-        del self._subscription_registry[watched_address]
+    def unsubscribe_many(self, keys: Iterable[str]):
+        """Unsubscribes from several addresses or transactions at once.
 
-        def _unsubscribe(_):
-            self.send_message(
-                self._build_payload(
-                    category_code="accountAddress",
-                    event_code="unwatch",
-                    data={"account": {"address": watched_address}},
-                )
+        The subscriptions are removed in a single pass over ``keys`` and their unwatch
+        messages are queued together.
+
+        Args:
+            keys: The addresses or transaction hashes to unsubscribe from.
+        """
+        removed = []
+        with self._registry_lock:
+            for key in keys:
+                subscription = self._remove_subscription(key)
+                if subscription is None:
+                    continue
+                removed.append((key, subscription.sub_type))
+                if subscription.sub_type == SubscriptionType.ADDRESS:
+                    self._tombstones[key] = None
+            while len(self._tombstones) > TOMBSTONE_CAPACITY:
+                self._tombstones.popitem(last=False)
+
+        if removed and self._is_connected():
+            self._send_messages(
+                [
+                    self._build_payload(
+                        category_code="accountAddress",
+                        event_code="unwatch",
+                        data={"account": {"address": key}},
+                    )
+                    if sub_type == SubscriptionType.ADDRESS
+                    else self._txn_unwatch_payload(key)
+                    for key, sub_type in removed
+                ]
             )
 
-        return _unsubscribe
+    def update_subscription(
+        self,
+        address: str,
+        filters: List[dict] = _UNCHANGED,
+        abi: Union[Abi, List[dict], str] = _UNCHANGED,
+    ):
+        """Changes the filters or the ABI of an address subscription in place.
+
+        The callback, batch policy and any pending batch are kept, and a single ``configs``
+        message is sent to the server instead of unwatching and watching the address again.
+
+        Args:
+            address: The watched address.
+            filters: The new filters. Left unchanged if omitted; pass None to remove them.
+            abi: The new ABI. Left unchanged if omitted; pass None to remove it.
+
+        Raises:
+            KeyError: If the address is not subscribed to.
+        """
+        if self.blockchain == BN_ETHEREUM:
+            address = address.lower()
+
+        with self._registry_lock:
+            subscription = self._subscription_registry.get(address)
+            if subscription is None or subscription.sub_type != SubscriptionType.ADDRESS:
+                raise KeyError(f"Not subscribed to address {address}")
+            data = dict(subscription.data)
+            if filters is not _UNCHANGED:
+                data["filters"] = filters
+            if abi is not _UNCHANGED:
+                data["abi"] = abi_store.intern(abi)
+            subscription.data = data
+            subscription.payload = None
+
+        if self._is_connected():
+            self.send_message(self._prepare_config_message(address, subscription))
+
+    def save_snapshot(self, path: str):
+        """Saves the address and transaction subscriptions to a file.
+
+        Callbacks, batch policies and transaction TTLs are not saved.
+
+        Args:
+            path: The path of the snapshot file. An existing file is replaced.
+        """
+        snapshot = Snapshot(self.blockchain, self.network_id)
+        with self._registry_lock:
+            for key, subscription in self._subscription_registry.items():
+                if subscription.sub_type == SubscriptionType.ADDRESS:
+                    snapshot.addresses.append(
+                        (key, subscription.data["filters"], subscription.data["abi"])
+                    )
+                else:
+                    snapshot.transactions.append((key, subscription.data))
+        write_snapshot(path, snapshot)
+
+    def load_snapshot(
+        self, path: str, callback: Callback, batch: BatchPolicy = None
+    ) -> int:
+        """Restores the subscriptions saved by ``save_snapshot``.
+
+        The messages which watch the saved addresses are encoded in bulk while loading, so
+        sending them on connect only patches in their timestamp.
+
+        Args:
+            path: The path of the snapshot file.
+            callback: The callback function that will get executed for every restored subscription.
+            batch: The batch policy of the restored address subscriptions.
+
+        Returns:
+            The number of restored subscriptions.
+
+        Raises:
+            ValueError: If the snapshot was taken from a stream on another network.
+        """
+        snapshot = read_snapshot(path)
+        if (snapshot.blockchain, snapshot.network_id) != (
+            self.blockchain,
+            self.network_id,
+        ):
+            raise ValueError(
+                f"Snapshot of {snapshot.blockchain} network {snapshot.network_id} cannot be "
+                f"loaded into a stream on {self.blockchain} network {self.network_id}"
+            )
+
+        encode = self._get_config_encoder().encode
+        restored = []
+        for address, filters, abi in snapshot.addresses:
+            subscription = Subscription(
+                callback,
+                {"filters": filters, "abi": abi},
+                SubscriptionType.ADDRESS,
+                batch,
+                encode(address, filters, abi),
+            )
+            restored.append((address, subscription))
+        for tx_hash, status in snapshot.transactions:
+            restored.append(
+                (tx_hash, Subscription(callback, status, SubscriptionType.TRANSACTION))
+            )
+
+        with self._registry_lock:
+            for key, subscription in restored:
+                self._add_subscription(key, subscription)
+
+        if self._is_connected():
+            for key, subscription in restored:
+                if subscription.sub_type == SubscriptionType.ADDRESS:
+                    self.send_message(subscription.payload)
+                else:
+                    self._send_txn_watch_message(key, subscription.data)
+        return len(restored)
+
+    def _add_subscription(self, key: str, subscription: Subscription):
+        """Adds a subscription to the registry, replacing any existing one for ``key``."""
+        with self._registry_lock:
+            self._remove_subscription(key)
+            self._tombstones.pop(key, None)
+            self._subscription_registry[key] = subscription
+            if subscription.sub_type == SubscriptionType.ADDRESS:
+                self.subscription_counts.addresses += 1
+            else:
+                self.subscription_counts.transactions += 1
+
+    def _remove_subscription(self, key: str) -> Subscription:
+        """Removes a subscription from the registry.
+
+        Returns:
+            The removed subscription, or None if there was no subscription for ``key``.
+        """
+        with self._registry_lock:
+            subscription = self._subscription_registry.pop(key, None)
+            self._pending_batches.pop(key, None)
+            if subscription is None:
+                return None
+            if subscription.sub_type == SubscriptionType.ADDRESS:
+                self.subscription_counts.addresses -= 1
+            else:
+                self.subscription_counts.transactions -= 1
+            return subscription
+
+    def _expire_subscriptions(self):
+        """Removes the transaction subscriptions whose TTL has elapsed and queues their
+        unwatch messages together.
+
+        Entries of subscriptions that were already removed or replaced are skipped.
+        """
+        now = time.monotonic()
+        expired = []
+        with self._registry_lock:
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                _, _, tx_hash, subscription = heapq.heappop(self._expiry_heap)
+                if self._subscription_registry.get(tx_hash) is subscription:
+                    self._remove_subscription(tx_hash)
+                    expired.append(tx_hash)
+
+        self.subscription_counts.expired += len(expired)
+        if expired and self._is_connected():
+            # Queued together, then paced by the send rate like any other message
+            self._send_messages([self._txn_unwatch_payload(tx_hash) for tx_hash in expired])
+
+    async def _subscription_expiry(self):
+        """In a loop: Expires transaction subscriptions whose TTL has elapsed.
+
+        Note:
+            This function runs until cancelled.
+        """
+        while True:
+            self._expire_subscriptions()
+            await trio.sleep(SUBSCRIPTION_EXPIRY_INTERVAL)
 
     async def _heartbeat(self):
-        """Send periodic pings on WebSocket.
+        """Send pings on WebSocket whenever the connection has been silent for too long.
 
-        Wait up to ``PING_TIMEOUT`` seconds to send a ping and receive a pong. Raises
-        ``TooSlowError`` if the timeout is exceeded. If a pong is received, then
-        wait ``PING_INTERVAL`` seconds before sending the next ping.
+        Inbound messages prove that the connection is alive, so a ping is only sent once
+        nothing has been received for ``health.ping_interval`` seconds, or to sample the
+        round-trip time when the connection opens and every ``health.sample_interval``
+        seconds. Waits up to ``health.ping_timeout`` seconds to receive the pong. Both adapt
+        to the measured round-trip time, bounded above by ``PING_INTERVAL`` and ``PING_TIMEOUT``.
 
         Note:
             This function runs until cancelled.
@@ -315,17 +946,51 @@ class Stream:
         """
 
         while True:
-            with trio.fail_after(PING_TIMEOUT):
+            delay = self.health.next_ping()
+            if delay > 0:
+                await trio.sleep(delay)
+                continue
+
+            start = time.monotonic()
+            with trio.fail_after(self.health.ping_timeout):
                 await self._ws.ping()
-            await trio.sleep(PING_INTERVAL)
+            self.health.on_rtt(time.monotonic() - start)
 
-    async def _handle_connection(self, base_url: str):
-        """Handles the setup once the websocket connection is established, as well as,
-        handles reconnect if the websocket closes for any reason.
+    async def _handle_connection(self):
+        """Handles the setup once the websocket connection is established, then runs the
+        connection's tasks.
 
         Note:
-            This function runs until cancelled.
+            This function runs until cancelled, or until the connection fails.
         """
+        self.health.reset()
+        self._queue_session_messages()
+
+        async with trio.open_nursery() as nursery:
+            for task in self._connection_tasks():
+                nursery.start_soon(task)
+
+    def _connection_tasks(self) -> List[Callable]:
+        """Returns the tasks which run for as long as a connection is open."""
+        return [
+            self._heartbeat,
+            self._poll_messages,
+            self._message_dispatcher,
+            self._subscription_expiry,
+        ]
+
+    def _queue_session_messages(self):
+        """Queues the handshake of a new connection, followed by the subscriptions.
+
+        Messages still queued for the previous connection are discarded: the subscriptions
+        are replayed from the registry after the new ``checkDappId`` handshake instead.
+        """
+        self._retry_queue.clear()
+        while True:
+            try:
+                self._message_queue.get_nowait()
+            except Empty:
+                break
 
         # If the user set global_filters then send them once _message_dispatcher starts
         if self.global_filters:
@@ -334,38 +999,62 @@ class Stream:
         # Queues up the init message which will be sent once _message_dispatcher starts
         self._queue_init_message()
 
+        # Don't replay subscriptions which expired while disconnected
+        self._expire_subscriptions()
+
         # Iterate over the registered subscriptions and push them onto the message queue
-        for sub_id, subscription in self._subscription_registry.items():
+        with self._registry_lock:
+            subscriptions = list(self._subscription_registry.items())
+        for sub_id, subscription in subscriptions:
             if subscription.sub_type == SubscriptionType.TRANSACTION:
                 self._send_txn_watch_message(sub_id, status=subscription.data)
             elif subscription.sub_type == SubscriptionType.ADDRESS:
-                self._send_config_message(
-                    sub_id, True, subscription.data["filters"], subscription.data["abi"]
-                )
+                self.send_message(self._prepare_config_message(sub_id, subscription))
 
-        try:
-            async with trio.open_nursery() as nursery:
-                nursery.start_soon(self._heartbeat)
-                nursery.start_soon(self._poll_messages)
-                nursery.start_soon(self._message_dispatcher)
-        except (ConnectionClosed, trio.MultiError, trio.TooSlowError) as error:
-            if isinstance(error, trio.TooSlowError):
-                logging.warn(
-                    f"Server failed to respond to ping within the given timeout of {PING_TIMEOUT} seconds."
-                )
-            logging.info("Attempting to reconnect...")
+    async def _connect(self, base_url):
+        """Connects to the server, and reconnects whenever the connection is lost.
+
+        Returns:
+            False if a handshake failed, None once the session ends.
+        """
+        from trio_websocket import ConnectionClosed, HandshakeError
+
+        self._attach_loop()
+        while True:
+            try:
+                async with open_websocket(
+                    base_url,
+                    self.compression,
+                    self.transport_stats,
+                    self.connector,
+                    on_receive=self.health.on_activity,
+                ) as ws:
+                    self._ws = ws
+                    await self._handle_connection()
+                return None
+            except HandshakeError:
+                logger.exception("Handshake failed")
+                return False
+            except (ConnectionClosed, trio.MultiError, trio.TooSlowError) as error:
+                if isinstance(error, trio.TooSlowError):
+                    logger.warning(
+                        "Server failed to respond to ping within the given timeout of %.1f seconds.",
+                        self.health.ping_timeout,
+                    )
+                logger.info("Attempting to reconnect...")
+            # The reconnect starts its own standby task, stop the one of this connection
+            self.connector.stop_standby(base_url)
             # If server times the connection out or drops, reconnect
             await trio.sleep(0.5)
-            await self._connect(base_url)
 
-    async def _connect(self, base_url):
-        try:
-            async with open_websocket_url(base_url) as ws:
-                self._ws = ws
-                await self._handle_connection(base_url)
-        except HandshakeError as e:
-            logging.exception("Handshake failed")
-            return False
+    async def _connect_hedged(self, base_url: str, hedge_url: str):
+        """Runs two connections which race to deliver each event."""
+        self._attach_loop()
+        self._legs = [_HedgeLeg(self, "primary"), _HedgeLeg(self, "hedge")]
+        async with trio.open_nursery() as nursery:
+            nursery.start_soon(self._legs[0]._connect, base_url)
+            nursery.start_soon(self._legs[1]._connect, hedge_url)
+            nursery.start_soon(self._subscription_expiry)
 
     def _is_connected(self) -> bool:
         """Tests whether the websocket is connected.
@@ -373,6 +1062,8 @@ class Stream:
         Returns:
             True if the websocket is connected, False otherwise.
         """
+        if self._legs:
+            return any(leg._is_connected() for leg in self._legs)
         return self._ws and not self._ws.closed
 
     def _send_config_message(
@@ -380,23 +1071,49 @@ class Stream:
         scope,
         watch_address=True,
         filters: List[dict] = None,
-        abi: List[dict] = None,
+        abi: Union[Abi, List[dict], str] = None,
     ):
         """Helper method which constructs and sends the payload for watching addresses.
 
+        Payloads with an ABI are encoded here, reusing the cached encoding of the ABI.
+
         Args:
             scope: The scope which this config applies to.
             watch_address: Indicates whether or not to watch the address  (if scope ==  `address`).
             filters: Filters used to filter out transactions for the given scope.
             abi: The ABI of the contract. Used if `scope` is a contract address.
         """
-        self.send_message(
-            self._build_payload(
-                category_code="configs",
-                event_code="put",
-                data=Config(scope, filters, abi, watch_address).as_dict(),
-            )
+        abi = abi_store.intern(abi)
+        payload = self._build_payload(
+            category_code="configs",
+            event_code="put",
+            data=Config(
+                scope, filters, abi.placeholder if abi is not None else None, watch_address
+            ).as_dict(),
         )
+        self.send_message(abi.encode_message(payload) if abi is not None else payload)
+
+    def _prepare_config_message(
+        self, address: str, subscription: Subscription
+    ) -> PreparedMessage:
+        """Returns the pre-encoded message which watches an address, encoding it on first use.
+
+        The message is cached on the subscription, so replaying subscriptions on reconnect
+        only patches in the timestamp.
+        """
+        if subscription.payload is None:
+            subscription.payload = self._get_config_encoder().encode(
+                address, subscription.data["filters"], subscription.data["abi"]
+            )
+        return subscription.payload
+
+    def _get_config_encoder(self) -> ConfigEncoder:
+        """Returns the encoder of the stream's configs put messages, creating it on first use."""
+        if self._config_encoder is None:
+            self._config_encoder = ConfigEncoder(
+                self._build_payload(category_code="configs", event_code="put")
+            )
+        return self._config_encoder
 
     def _send_txn_watch_message(self, txn_hash: str, status: str = "sent"):
         """Helper method which constructs and sends the payload for watching transactions.
@@ -420,6 +1137,22 @@ class Stream:
             )
         )
 
+    def _send_txn_unwatch_message(self, txn_hash: str):
+        """Helper method which constructs and sends the payload for unwatching a transaction.
+
+        Args:
+            txn_hash: The hash of the transaction to unwatch.
+        """
+        self.send_message(self._txn_unwatch_payload(txn_hash))
+
+    def _txn_unwatch_payload(self, txn_hash: str) -> dict:
+        """Returns the payload which unwatches a transaction."""
+        return self._build_payload(
+            "activeTransaction",
+            event_code="unwatch",
+            data={"transaction": {"hash": txn_hash}},
+        )
+
     def _build_payload(
         self,
         category_code: str,
@@ -477,3 +1210,53 @@ class Stream:
             if not isinstance(k, dict) and not isinstance(k, list):
                 transaction[k] = eventcopy[k]
         return transaction
+
+
+class _HedgeLeg(Stream):
+    """One of the two connections of a hedged stream.
+
+    A leg owns its websocket, send queues and health, and shares the subscription registry
+    and send rate of the stream that owns it, which also expires the subscriptions. Events
+    are handed to the owner only if this leg received them first. Errors such as rate limits
+    are handled by the leg itself.
+    """
+
+    def __init__(self, owner: Stream, name: str):
+        super().__init__(
+            owner.api_key,
+            owner.blockchain,
+            owner.network_id,
+            owner.global_filters,
+            send_rate=owner._send_rate,
+            compression=owner.compression,
+            connector=owner.connector,
+        )
+        self.name = name
+        self.transport_stats = owner.transport_stats
+        self._owner = owner
+        self._subscription_registry = owner._subscription_registry
+        self._pending_batches = owner._pending_batches
+        self._tombstones = owner._tombstones
+        self._registry_lock = owner._registry_lock
+        self.profiler = owner.profiler
+
+    def _connection_tasks(self) -> List[Callable]:
+        # The owner expires the subscriptions shared by its legs
+        return [self._heartbeat, self._poll_messages, self._message_dispatcher]
+
+    def _expire_subscriptions(self):
+        self._owner._expire_subscriptions()
+
+    async def _message_handler(self, message: dict):
+        event = message.get("event")
+        if message.get("status") != "ok" or not event or "transaction" not in event:
+            return await super()._message_handler(message)
+
+        transaction = event["transaction"]
+        key = (
+            transaction.get("hash"),
+            event.get("eventCode"),
+            transaction.get("watchedAddress"),
+        )
+        if self._owner._first_arrivals.first_arrival(key, self.name):
+            await self._owner._message_handler(message)
@@ -0,0 +1,71 @@
+"""Logging helpers which keep the cost of logging off the per-message hot path.
+"""
+import logging
+import time
+
+LOG_INTERVAL = 10  # seconds between two occurrences of a rate-limited log message
+TRACE_SAMPLE_RATE = 100  # one in this many messages is traced
+
+
+class RateLimitedLog:
+    """Logs a recurring message at most once every ``interval`` seconds.
+
+    Occurrences in between are counted, and the count is appended to the next message
+    that gets logged.
+
+    Args:
+        logger: The logger to log to.
+        interval: The minimum number of seconds between two logged messages.
+    """
+
+    def __init__(self, logger: logging.Logger, interval: float = LOG_INTERVAL):
+        self.logger = logger
+        self.interval = interval
+        self._next_at = 0.0
+        self._suppressed = 0
+
+    def log(self, level: int, msg: str, *args):
+        """Logs ``msg % args`` at ``level``, unless a message was logged recently."""
+        if not self.logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        if now < self._next_at:
+            self._suppressed += 1
+            return
+        if self._suppressed:
+            msg += " (%d similar messages suppressed)"
+            args += (self._suppressed,)
+        self._next_at = now + self.interval
+        self._suppressed = 0
+        self.logger.log(level, msg, *args)
+
+
+class TrafficTrace:
+    """Logs a sample of the messages sent and received, at debug level.
+
+    Nothing is done unless the logger is enabled for debug messages.
+
+    Args:
+        logger: The logger to log to.
+        sample_rate: One in this many messages in each direction is logged.
+    """
+
+    def __init__(self, logger: logging.Logger, sample_rate: int = TRACE_SAMPLE_RATE):
+        self.logger = logger
+        self.sample_rate = sample_rate
+        self._sent = 0
+        self._received = 0
+
+    def sent(self, message: str):
+        """Traces an outbound message."""
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self._sent += 1
+            if self._sent % self.sample_rate == 1 or self.sample_rate == 1:
+                self.logger.debug("Sent message #%d: %s", self._sent, message)
+
+    def received(self, message: str):
+        """Traces an inbound message."""
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self._received += 1
+            if self._received % self.sample_rate == 1 or self.sample_rate == 1:
+                self.logger.debug("Received message #%d: %s", self._received, message)
@@ -1,8 +1,21 @@
 """Helper methods used throughout the codebase.
 """
 from enum import Enum
+from functools import lru_cache
 from blocknative.exceptions import *
 
+NETWORK_NAMES = {
+    1: "main",
+    3: "ropsten",
+    4: "rinkeby",
+    5: "goerli",
+    42: "kovan",
+    100: "xdai",
+    56: "bsc-main",
+    137: "matic-main",
+    250: "fantom-main",
+}
+
 
 class ErrorReason(Enum):
     """Enum respresenting the different possible error states"""
@@ -64,17 +77,7 @@ def network_id_to_name(network_id: int) -> str:
     Returns:
         The network name.
     """
-    return {
-        1: "main",
-        3: "ropsten",
-        4: "rinkeby",
-        5: "goerli",
-        42: "kovan",
-        100: "xdai",
-        56: "bsc-main",
-        137: "matic-main",
-        250: "fantom-main",
-    }[network_id]
+    return NETWORK_NAMES[network_id]
 
 
 def status_to_event_code(status: str):
@@ -146,6 +149,7 @@ def subscription_type(message: dict):
         return SubscriptionType.ADDRESS
 
 
+@lru_cache(maxsize=256)
 def to_camel_case(string: str):
     """Converts the provided string into camel case
     Args:
@@ -0,0 +1,26 @@
+from blocknative.multi import MultiNetworkStream
+import json,sys,traceback,logging
+
+# Ethereum mainnet, BSC, Polygon and Fantom
+NETWORK_IDS = [1, 56, 137, 250]
+
+async def txn_handler(network, txn, unsubscribe):
+    # Output the network and the transaction data to the console
+    print(network, json.dumps(txn, indent=4))
+
+if __name__ == '__main__':
+        if len(sys.argv) == 1:
+            print('%s apikey' % sys.argv[0])
+        else:
+            try:
+                logging.basicConfig(level=logging.INFO)
+                apikeyfile = sys.argv[1]
+                with open(apikeyfile, 'r') as apikey:
+                    keystring = apikey.readline().rstrip().lstrip()
+                    stream = MultiNetworkStream(keystring, NETWORK_IDS, txn_handler)
+                    stream.subscribe_address(1, '0x7a250d5630b4cf539739df2c5dacb4c659f2488d')
+                    stream.subscribe_address(56, '0x10ed43c718714eb63d5aa57b78b54704e256024e')
+                    stream.connect()
+            except Exception as e:
+                logging.error('API Failed: %s', str(e))
+                traceback.print_exc(e)
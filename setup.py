@@ -23,6 +23,19 @@ with open(
 ) as f:
     requirements = f.read().split("\n")
 
+# The websocket layer relies on internals of trio-websocket: allow only the releases it is
+# tested against rather than the exact pins
+_BOUNDED = {
+    "trio": "trio>=0.22,<0.23",
+    "trio-websocket": "trio-websocket>=0.12,<0.13",
+    "wsproto": "wsproto>=1.2,<2",
+}
+requirements = [
+    _BOUNDED.get(requirement.split("==")[0], requirement)
+    for requirement in requirements
+    if requirement
+]
+
 setup(
     name="blocknative-sdk",
     version=version,
@@ -0,0 +1,72 @@
+import gc
+import json
+import unittest
+from blocknative.abi import Abi, AbiStore
+from blocknative.stream import Stream as BNStream
+
+ERC20_ABI = [
+  {
+    'name': 'transfer',
+    'type': 'function',
+    'inputs': [{'name': 'to', 'type': 'address'}, {'name': 'value', 'type': 'uint256'}],
+  },
+  {
+    'name': 'approve',
+    'type': 'function',
+    'inputs': [{'name': 'spender', 'type': 'address'}, {'name': 'value', 'type': 'uint256'}],
+  },
+]
+
+
+async def _noop_callback(*args):
+  pass
+
+
+class TestAbiStore(unittest.TestCase):
+  def test_same_content_is_interned_once(self):
+    store = AbiStore()
+    from_list = store.intern(ERC20_ABI)
+    from_text = store.intern(json.dumps(ERC20_ABI, indent=2))
+
+    self.assertIs(from_list, from_text)
+    self.assertIs(store.intern(from_list), from_list)
+    self.assertEqual(len(store), 1)
+    self.assertEqual(json.loads(from_list.encoded), ERC20_ABI)
+    self.assertEqual(from_list[0]['name'], 'transfer')
+
+  def test_interned_abi_is_immutable(self):
+    abi = AbiStore().intern(ERC20_ABI)
+    with self.assertRaises(TypeError):
+      abi[0]['name'] = 'mint'
+    with self.assertRaises(TypeError):
+      abi[0]['inputs'][0] = {}
+
+  def test_unreferenced_abi_is_dropped(self):
+    store = AbiStore()
+    store.intern(json.dumps(ERC20_ABI))
+    gc.collect()
+    self.assertEqual(len(store), 0)
+
+  def test_subscriptions_share_abi(self):
+    stream = BNStream('abc123')
+    for i in range(100):
+      stream.subscribe_address(f'0x{i:040x}', _noop_callback, abi=json.dumps(ERC20_ABI))
+
+    abis = {id(sub.data['abi']) for sub in stream._subscription_registry.values()}
+    self.assertEqual(len(abis), 1)
+    self.assertIsInstance(stream._subscription_registry['0x' + '0' * 40].data['abi'], Abi)
+
+  def test_config_message_embeds_encoded_abi(self):
+    stream = BNStream('abc123')
+    stream._send_config_message('0xabc', True, [{'status': 'pending'}], ERC20_ABI)
+
+    message = stream._message_queue.get_nowait()
+    self.assertIsInstance(message, str)
+    config = json.loads(message)['config']
+    self.assertEqual(config['abi'], ERC20_ABI)
+    self.assertEqual(config['scope'], '0xabc')
+    self.assertEqual(config['filters'], [{'status': 'pending'}])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,135 @@
+import json
+import unittest
+import trio
+import trio.testing
+from blocknative.confirmations import ConfirmationScheduler
+from blocknative.exceptions import TransactionDroppedError
+from blocknative.stream import Stream as BNStream
+from stream_test import example_transaction
+
+
+def _transaction(tx_hash, status, block_number):
+  if status == 'confirmed':
+    return {'hash': tx_hash, 'status': status, 'blockNumber': block_number}
+  return {'hash': tx_hash, 'status': status, 'blockNumber': None, 'pendingBlockNumber': block_number}
+
+
+class TestConfirmationScheduler(unittest.TestCase):
+  def test_waits_resolve_at_target_height(self):
+    async def main():
+      scheduler = ConfirmationScheduler()
+      one = scheduler.watch('0x1', 1)
+      three = scheduler.watch('0x1', 3)
+      scheduler.observe(_transaction('0x1', 'confirmed', 100))
+      self.assertTrue(one.event.is_set())
+      self.assertFalse(three.event.is_set())
+
+      scheduler.observe(_transaction('0x2', 'pending', 101))
+      self.assertFalse(three.event.is_set())
+      scheduler.observe(_transaction('0x3', 'pending', 102))
+      self.assertEqual(await one.wait(), 100)
+      self.assertEqual(await three.wait(), 102)
+      self.assertEqual(len(scheduler), 0)
+    trio.run(main)
+
+  def test_wait_after_inclusion(self):
+    async def main():
+      scheduler = ConfirmationScheduler()
+      scheduler.observe(_transaction('0x1', 'confirmed', 100))
+      scheduler.observe(_transaction('0x2', 'confirmed', 105))
+      self.assertEqual(await scheduler.watch('0x1', 2).wait(), 105)
+    trio.run(main)
+
+  def test_dropped_transaction_raises(self):
+    async def main():
+      scheduler = ConfirmationScheduler()
+      waiter = scheduler.watch('0x1', 2)
+      scheduler.observe(_transaction('0x1', 'dropped', 100))
+      with self.assertRaises(TransactionDroppedError):
+        await waiter.wait()
+    trio.run(main)
+
+  def test_cancelled_waits_are_discarded(self):
+    async def main():
+      scheduler = ConfirmationScheduler()
+      with trio.move_on_after(0.01):
+        await scheduler.watch('0x1', 2).wait()
+      self.assertEqual(len(scheduler), 0)
+      self.assertEqual(scheduler._parked, {})
+
+      scheduler.observe(_transaction('0x2', 'confirmed', 100))
+      kept = scheduler.watch('0x2', 3)
+      for _ in range(10):
+        with trio.move_on_after(0.01):
+          await scheduler.watch('0x2', 3).wait()
+      self.assertEqual(len(scheduler), 1)
+      self.assertLess(len(scheduler._heap), 10)
+
+      scheduler.observe(_transaction('0x3', 'pending', 102))
+      self.assertEqual(await kept.wait(), 102)
+      self.assertEqual(len(scheduler), 0)
+      self.assertEqual(scheduler._heap, [])
+    trio.run(main)
+
+
+class TestStreamWaitConfirmations(unittest.TestCase):
+  def test_wait_confirmations_many(self):
+    stream = BNStream('')
+    event = json.loads(example_transaction)
+    tx_hash = event['transaction']['hash']
+    block_number = event['transaction']['blockNumber']
+    results = {}
+
+    async def main():
+      async with trio.open_nursery() as nursery:
+        async def wait():
+          results.update(await stream.wait_confirmations_many([tx_hash], 2))
+        nursery.start_soon(wait)
+        await trio.testing.wait_all_tasks_blocked()
+        self.assertIn(tx_hash, stream._subscription_registry)
+
+        await stream._message_handler({'status': 'ok', 'event': event})
+        next_block = json.loads(example_transaction)
+        next_block['transaction'].update(hash='0x2', blockNumber=block_number + 1)
+        await stream._message_handler({'status': 'ok', 'event': next_block})
+
+    trio.run(main)
+    self.assertEqual(results, {tx_hash: block_number + 1})
+
+  def test_single_wait_keeps_its_subscription_until_resolved(self):
+    stream = BNStream('')
+    event = json.loads(example_transaction)
+    event['categoryCode'] = 'activeTransaction'
+    tx_hash = event['transaction']['hash']
+    block_number = event['transaction']['blockNumber']
+    results = []
+
+    def at_block(offset):
+      later = json.loads(json.dumps(event))
+      later['eventCode'] = 'txPool'
+      later['transaction'].update(status='pending', blockNumber=None, pendingBlockNumber=block_number + offset)
+      return {'status': 'ok', 'event': later}
+
+    async def main():
+      async with trio.open_nursery() as nursery:
+        async def wait():
+          results.append(await stream.wait_confirmations(tx_hash, 3))
+        nursery.start_soon(wait)
+        await trio.testing.wait_all_tasks_blocked()
+
+        await stream._message_handler({'status': 'ok', 'event': event})
+        # Confirmed, but kept so that later events keep advancing the head
+        self.assertIn(tx_hash, stream._subscription_registry)
+        await stream._message_handler(at_block(1))
+        self.assertIn(tx_hash, stream._subscription_registry)
+        await stream._message_handler(at_block(2))
+
+    trio.run(main)
+    self.assertEqual(results, [block_number + 2])
+    self.assertNotIn(tx_hash, stream._subscription_registry)
+    self.assertEqual(stream.subscription_counts.retired, 1)
+    self.assertEqual(len(stream._confirmations), 0)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+from importlib import metadata
+from functools import partial
+import trio
+import trio.testing
+from wsproto import ConnectionType, WSConnection
+from wsproto.events import AcceptConnection, CloseConnection, Request, TextMessage
+from wsproto.extensions import PerMessageDeflate
+from blocknative.connection import open_websocket, Compression, TransportStats
+from stream_test import example_transaction
+
+MESSAGE_COUNT = 200
+
+
+async def _deflate_server(messages, stream):
+  """Minimal websocket server which accepts permessage-deflate when it is offered."""
+  ws = WSConnection(ConnectionType.SERVER)
+  while True:
+    data = await stream.receive_some()
+    if not data:
+      return
+    ws.receive_data(data)
+    for event in ws.events():
+      if isinstance(event, Request):
+        await stream.send_all(ws.send(AcceptConnection(extensions=[PerMessageDeflate()])))
+        for message in messages:
+          await stream.send_all(ws.send(TextMessage(data=message)))
+      elif isinstance(event, CloseConnection):
+        await stream.send_all(ws.send(event.response()))
+        return
+
+
+async def _receive_all(compression):
+  stats = TransportStats()
+  received = []
+  async with trio.open_nursery() as nursery:
+    listeners = await nursery.start(
+      trio.serve_tcp, partial(_deflate_server, [example_transaction] * MESSAGE_COUNT), 0
+    )
+    port = listeners[0].socket.getsockname()[1]
+    async with open_websocket(f'ws://127.0.0.1:{port}', compression, stats) as ws:
+      for _ in range(MESSAGE_COUNT):
+        received.append(await ws.get_message())
+    nursery.cancel_scope.cancel()
+  return received, stats
+
+
+class TestPermessageDeflate(unittest.TestCase):
+  def test_compression_reduces_bytes_on_wire(self):
+    plain, plain_stats = trio.run(_receive_all, None)
+    deflated, deflated_stats = trio.run(_receive_all, Compression(window_bits=12, memory_level=4))
+
+    self.assertEqual(plain, deflated)
+    self.assertGreater(plain_stats.bytes_received, len(example_transaction) * MESSAGE_COUNT)
+    self.assertLess(deflated_stats.bytes_received * 10, plain_stats.bytes_received)
+
+  def test_arrival_is_reported_before_messages_are_read(self):
+    arrivals = []
+
+    async def main():
+      async with trio.open_nursery() as nursery:
+        listeners = await nursery.start(
+          trio.serve_tcp, partial(_deflate_server, [example_transaction] * MESSAGE_COUNT), 0
+        )
+        port = listeners[0].socket.getsockname()[1]
+        async with open_websocket(f'ws://127.0.0.1:{port}', on_receive=lambda: arrivals.append(1)) as _:
+          # Reported while nothing has been read off the websocket
+          with trio.fail_after(5):
+            while not arrivals:
+              await trio.sleep(0.01)
+        nursery.cancel_scope.cancel()
+
+    trio.run(main)
+
+  def test_window_bits_are_validated(self):
+    with self.assertRaises(ValueError):
+      Compression(window_bits=20).extension()
+
+
+class TestWebsocketInternals(unittest.TestCase):
+  """Guards the trio-websocket and wsproto internals used by the upgrade, by compression
+  and by the batching of buffered messages, which may change between releases."""
+
+  def test_supported_release(self):
+    version = metadata.version('trio-websocket')
+    self.assertEqual(tuple(int(part) for part in version.split('.')[:2]), (0, 12))
+
+  def test_internals_exist(self):
+    from trio_websocket import WebSocketConnection
+    ws = WebSocketConnection(trio.testing.MemoryReceiveStream(), WSConnection(ConnectionType.CLIENT), host='localhost', path='/')
+    self.assertIsInstance(ws._initial_request, Request)
+    self.assertEqual(ws._initial_request.extensions, [])
+    self.assertIsInstance(ws._open_handshake, trio.Event)
+    self.assertTrue(callable(ws._reader_task))
+    self.assertGreaterEqual(ws._recv_channel.statistics().current_buffer_used, 0)
+
+  def test_deflate_internals_exist(self):
+    # The compressor of the configurable memory level replaces wsproto's own
+    self.assertEqual(int(metadata.version('wsproto').split('.')[0]), 1)
+    extension = PerMessageDeflate()
+    self.assertIsNone(extension._compressor)
+    self.assertEqual(extension.client_max_window_bits, 15)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,97 @@
+import json
+import threading
+import time
+import unittest
+import trio
+import trio.testing
+from blocknative.stream import Stream as BNStream
+
+addresses = [
+  '0x7a250d5630b4cf539739df2c5dacb4c659f2488d',
+  '0xdf5e0e81dff6faf3a7e52ba697820c5e32d806a8',
+  '0xd9e1ce17f2641f24ae83637ab66a2cca9c378b9f',
+]
+
+
+async def callback(txn, unsubscribe):
+  pass
+
+
+class _RecordingWebSocket:
+  """Websocket which records the messages sent on it."""
+  closed = None
+
+  def __init__(self):
+    self.sent = []
+    self.sent_event = threading.Event()
+
+  async def send_message(self, message):
+    self.sent.append((time.perf_counter(), json.loads(message)))
+    self.sent_event.set()
+
+
+class _RunningStream:
+  """Runs the dispatcher of a stream in a background trio loop."""
+
+  def __init__(self, stream, clock=None):
+    self.stream = stream
+    self.stream._ws = _RecordingWebSocket()
+    self.started = threading.Event()
+    self.thread = threading.Thread(target=trio.run, args=(self._main,), kwargs={'clock': clock})
+
+  async def _main(self):
+    self.stream._attach_loop()
+    with trio.CancelScope() as self.cancel_scope:
+      self.started.set()
+      await self.stream._message_dispatcher()
+
+  def __enter__(self):
+    self.thread.start()
+    self.started.wait()
+    return self.stream._ws
+
+  def __exit__(self, *args):
+    self.stream._trio_token.run_sync_soon(self.cancel_scope.cancel)
+    self.thread.join()
+
+
+class TestStreamController(unittest.TestCase):
+  def test_applied_immediately_when_not_running(self):
+    stream = BNStream('')
+    future = stream.control.subscribe_address(addresses[0], callback)
+    self.assertTrue(future.done())
+    self.assertIn(addresses[0], stream._subscription_registry)
+
+  def test_cross_thread_subscribe_is_sent_without_polling(self):
+    stream = BNStream('')
+    # Time stands still in the stream's loop, so a dispatcher which polls would never send
+    with _RunningStream(stream, trio.testing.MockClock()) as ws:
+      stream.control.subscribe_address(addresses[0], callback).result(timeout=1)
+      self.assertTrue(ws.sent_event.wait(timeout=1))
+
+    self.assertIn(addresses[0], stream._subscription_registry)
+    _, message = ws.sent[0]
+    self.assertEqual(message['config']['scope'], addresses[0])
+
+  def test_batched_operations(self):
+    stream = BNStream('')
+    with _RunningStream(stream):
+      future = stream.control.submit(
+        [lambda s, address=address: s.subscribe_address(address, callback) for address in addresses]
+      )
+      self.assertEqual(future.result(timeout=1), [None] * len(addresses))
+      stream.control.unsubscribe(addresses[0]).result(timeout=1)
+
+    self.assertEqual(list(stream._subscription_registry), addresses[1:])
+    self.assertEqual(stream.subscription_counts.addresses, 2)
+
+  def test_errors_are_set_on_the_future(self):
+    stream = BNStream('')
+    with _RunningStream(stream):
+      future = stream.control.subscribe_address(addresses[0], callback, abi='not json')
+      with self.assertRaises(ValueError):
+        future.result(timeout=1)
+
+
+if __name__ == '__main__':
+  unittest.main()
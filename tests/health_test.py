@@ -0,0 +1,118 @@
+import time
+import unittest
+import trio
+from blocknative.health import ConnectionHealth
+from blocknative.stream import Stream as BNStream
+
+
+class _SilentWebSocket:
+  """Websocket whose pings are never answered."""
+  pings = 0
+
+  async def ping(self):
+    self.pings += 1
+    await trio.sleep_forever()
+
+
+class _AnsweringWebSocket:
+  """Websocket whose pings are answered after a fixed delay."""
+  pings = 0
+
+  def __init__(self, rtt):
+    self.rtt = rtt
+
+  async def ping(self):
+    self.pings += 1
+    await trio.sleep(self.rtt)
+
+
+class TestConnectionHealth(unittest.TestCase):
+  def test_defaults_before_first_sample(self):
+    health = ConnectionHealth(max_interval=15, max_timeout=10)
+    self.assertEqual(health.ping_interval, 15)
+    self.assertEqual(health.ping_timeout, 10)
+    self.assertEqual(health.silence_threshold, 25)
+
+  def test_rtt_is_smoothed(self):
+    health = ConnectionHealth()
+    health.on_rtt(0.1)
+    self.assertAlmostEqual(health.srtt, 0.1)
+    self.assertAlmostEqual(health.rttvar, 0.05)
+    health.on_rtt(0.5)
+    self.assertAlmostEqual(health.srtt, 0.15)
+    self.assertAlmostEqual(health.rttvar, 0.1375)
+
+  def test_interval_and_timeout_adapt_to_rtt(self):
+    health = ConnectionHealth(min_interval=2, max_interval=15, min_timeout=1, max_timeout=10)
+    health.on_rtt(0.05)
+    self.assertEqual(health.ping_timeout, 1)
+    self.assertEqual(health.ping_interval, 3)
+    self.assertEqual(health.silence_threshold, 4)
+
+    for _ in range(20):
+      health.on_rtt(20)
+    self.assertEqual(health.ping_timeout, 10)
+    self.assertEqual(health.ping_interval, 15)
+
+  def test_activity_resets_idle_time(self):
+    health = ConnectionHealth()
+    health.last_activity -= 30
+    self.assertGreaterEqual(health.idle_time(), 30)
+    health.on_activity()
+    self.assertLess(health.idle_time(), 1)
+
+
+class TestHeartbeat(unittest.TestCase):
+  def test_silent_connection_is_detected_early(self):
+    stream = BNStream('')
+    stream.health = ConnectionHealth(min_interval=0.05, max_interval=0.05, min_timeout=0.05, max_timeout=0.05)
+    stream._ws = _SilentWebSocket()
+
+    start = time.monotonic()
+    with self.assertRaises(trio.TooSlowError):
+      trio.run(stream._heartbeat)
+    self.assertLess(time.monotonic() - start, 1)
+    self.assertEqual(stream._ws.pings, 1)
+
+  def test_busy_connection_is_not_pinged(self):
+    stream = BNStream('')
+    stream.health = ConnectionHealth(min_interval=0.05, max_interval=0.05, min_timeout=0.05, max_timeout=0.05)
+    stream.health.last_sample = time.monotonic()
+    stream._ws = _SilentWebSocket()
+
+    async def main():
+      async with trio.open_nursery() as nursery:
+        nursery.start_soon(stream._heartbeat)
+        for _ in range(10):
+          stream.health.on_activity()
+          await trio.sleep(0.02)
+        nursery.cancel_scope.cancel()
+
+    trio.run(main)
+    self.assertEqual(stream._ws.pings, 0)
+
+  def test_rtt_is_sampled_on_busy_connection(self):
+    # Production bounds: a 15s interval and a 10s timeout until an RTT is measured
+    stream = BNStream('')
+    stream.health = ConnectionHealth(max_interval=15, max_timeout=10, sample_interval=0.1)
+    stream.health.reset()
+    stream._ws = _AnsweringWebSocket(0.01)
+    self.assertEqual(stream.health.silence_threshold, 25)
+
+    async def main():
+      async with trio.open_nursery() as nursery:
+        nursery.start_soon(stream._heartbeat)
+        for _ in range(15):
+          stream.health.on_activity()
+          await trio.sleep(0.02)
+        nursery.cancel_scope.cancel()
+
+    trio.run(main)
+    # Sampled when the connection opened, and refreshed while traffic kept flowing
+    self.assertGreaterEqual(stream._ws.pings, 2)
+    self.assertEqual(stream.health.ping_timeout, 3)
+    self.assertEqual(stream.health.silence_threshold, 12)
+
+
+if __name__ == '__main__':
+  unittest.main()
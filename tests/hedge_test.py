@@ -0,0 +1,94 @@
+import json
+import unittest
+import trio
+from blocknative.hedge import FirstArrivalFilter, HedgeStats
+from blocknative.stream import Stream as BNStream, _HedgeLeg
+from stream_test import example_transaction
+
+uniswap_v2_address = '0x7a250d5630b4cf539739df2c5dacb4c659f2488d'
+tx_hash = '0xabababababababababababababababababababababababababababababababab'
+
+
+class TestFirstArrivalFilter(unittest.TestCase):
+  def test_second_copy_is_dropped(self):
+    stats = HedgeStats()
+    seen = FirstArrivalFilter(stats)
+    self.assertTrue(seen.first_arrival(('0x1', 'txPool'), 'primary'))
+    self.assertFalse(seen.first_arrival(('0x1', 'txPool'), 'hedge'))
+    self.assertTrue(seen.first_arrival(('0x1', 'txConfirmed'), 'hedge'))
+    self.assertEqual(stats.wins, {'primary': 1})
+    self.assertEqual(len(stats.gaps), 1)
+
+  def test_repeat_on_same_leg_is_delivered(self):
+    seen = FirstArrivalFilter(HedgeStats())
+    self.assertTrue(seen.first_arrival('key', 'primary'))
+    self.assertTrue(seen.first_arrival('key', 'primary'))
+
+  def test_seen_set_is_bounded(self):
+    seen = FirstArrivalFilter(HedgeStats(), capacity=10)
+    for key in range(100):
+      seen.first_arrival(key, 'primary')
+    self.assertEqual(len(seen._seen), 10)
+    # The oldest keys were evicted, so their late copies get through
+    self.assertTrue(seen.first_arrival(0, 'hedge'))
+    self.assertFalse(seen.first_arrival(99, 'hedge'))
+
+  def test_percentiles(self):
+    stats = HedgeStats()
+    for gap in range(100):
+      stats.record('hedge', gap / 1000)
+    self.assertEqual(stats.percentile(50), 0.05)
+    self.assertEqual(stats.summary()['gap_p99'], 0.099)
+
+
+class TestHedgedStream(unittest.TestCase):
+  def setUp(self):
+    self.stream = BNStream('')
+    self.stream._legs = [_HedgeLeg(self.stream, 'primary'), _HedgeLeg(self.stream, 'hedge')]
+
+  def test_event_is_delivered_once(self):
+    received = []
+
+    async def callback(txn, unsubscribe):
+      received.append(txn['hash'])
+
+    self.stream.subscribe_address(uniswap_v2_address, callback)
+    message = {'status': 'ok', 'event': json.loads(example_transaction)}
+    primary, hedge = self.stream._legs
+    trio.run(hedge._message_handler, message)
+    trio.run(primary._message_handler, message)
+
+    self.assertEqual(received, [message['event']['transaction']['hash']])
+    self.assertEqual(self.stream.hedge_stats.wins, {'hedge': 1})
+
+  def test_legs_share_the_registry(self):
+    async def callback(txn, unsubscribe):
+      pass
+
+    self.stream.subscribe_address(uniswap_v2_address, callback)
+    for leg in self.stream._legs:
+      self.assertIn(uniswap_v2_address, leg._subscription_registry)
+
+  def test_messages_are_sent_on_every_leg(self):
+    self.stream.send_message({'eventCode': 'checkDappId'})
+    for leg in self.stream._legs:
+      self.assertEqual(leg._message_queue.get_nowait(), {'eventCode': 'checkDappId'})
+
+  def test_legs_share_the_send_rate(self):
+    for leg in self.stream._legs:
+      self.assertIs(leg._send_rate, self.stream._send_rate)
+
+  def test_owner_expires_the_subscriptions(self):
+    async def callback(txn, unsubscribe):
+      pass
+
+    primary, hedge = self.stream._legs
+    self.assertNotIn(primary._subscription_expiry, primary._connection_tasks())
+    self.stream.subscribe_txn(tx_hash, callback, ttl=0)
+    primary._expire_subscriptions()
+    self.assertNotIn(tx_hash, self.stream._subscription_registry)
+    self.assertEqual(self.stream.subscription_counts.expired, 1)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,75 @@
+import json
+import unittest
+from contextlib import aclosing
+from unittest import mock
+import trio
+from blocknative.multi import MultiNetworkStream
+from stream_test import example_transaction
+
+uniswap_v2_address = '0x7a250d5630b4cf539739df2c5dacb4c659f2488d'
+
+
+class TestMultiNetworkStream(unittest.TestCase):
+  def test_registry_is_keyed_by_network_and_address(self):
+    multi = MultiNetworkStream('', [1, 56])
+    multi.subscribe_address(1, uniswap_v2_address)
+    multi.subscribe_address(56, uniswap_v2_address)
+    self.assertEqual(
+      set(multi._subscription_registry),
+      {('main', uniswap_v2_address), ('bsc-main', uniswap_v2_address)},
+    )
+    self.assertEqual(list(multi.stream(56)._subscription_registry), [uniswap_v2_address])
+
+    multi.unsubscribe(56, uniswap_v2_address)
+    self.assertEqual(set(multi._subscription_registry), {('main', uniswap_v2_address)})
+
+  def test_unknown_network_is_rejected(self):
+    multi = MultiNetworkStream('', [1])
+    with self.assertRaises(KeyError):
+      multi.subscribe_address(137, uniswap_v2_address)
+
+  def test_events_are_tagged_with_network(self):
+    received = []
+
+    async def callback(network, txn, unsubscribe):
+      received.append((network, txn['hash']))
+
+    multi = MultiNetworkStream('', [1, 56], callback)
+    multi.subscribe_address(56, uniswap_v2_address)
+
+    message = {'status': 'ok', 'event': json.loads(example_transaction)}
+    # Only the BSC stream holds a subscription for this address
+    trio.run(multi.stream(1)._message_handler, message)
+    trio.run(multi.stream(56)._message_handler, message)
+    self.assertEqual(received, [('bsc-main', message['event']['transaction']['hash'])])
+
+  def test_events_iterator_without_callback(self):
+    multi = MultiNetworkStream('', [1])
+    multi.subscribe_address(1, uniswap_v2_address)
+    message = {'status': 'ok', 'event': json.loads(example_transaction)}
+
+    async def main():
+      await multi.stream(1)._message_handler(message)
+      async with aclosing(multi.events()) as events:
+        async for network, txn in events:
+          return network, txn['watchedAddress']
+
+    self.assertEqual(trio.run(main), ('main', uniswap_v2_address))
+
+  def test_run_closes_every_connector(self):
+    multi = MultiNetworkStream('', [1, 56])
+    connected = []
+    for stream in multi._streams.values():
+      async def connect(base_url, stream=stream):
+        connected.append((stream.network_id, base_url))
+      stream._connect = connect
+      stream.connector.aclose = mock.AsyncMock()
+
+    trio.run(multi.run, 'wss://example')
+    self.assertEqual(sorted(connected), [(1, 'wss://example'), (56, 'wss://example')])
+    for stream in multi._streams.values():
+      stream.connector.aclose.assert_awaited_once()
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,126 @@
+import json
+import os
+import signal
+import tempfile
+import threading
+import time
+import types
+import unittest
+from unittest import mock
+import trio
+import trio.testing
+from blocknative.profiling import Profiler
+from blocknative.stream import Stream as BNStream
+from stream_test import _BufferedWebSocket, example_transaction
+
+ADDRESS = '0x7a250d5630b4cf539739df2c5dacb4c659f2488d'
+PREFIX = 'poll_messages;message_handler'
+
+
+def _run_messages(stream, count):
+  message = json.dumps({'status': 'ok', 'event': json.loads(example_transaction)})
+  stream._ws = _BufferedWebSocket([message] * count)
+
+  async def main():
+    async with trio.open_nursery() as nursery:
+      nursery.start_soon(stream._poll_messages)
+      await trio.testing.wait_all_tasks_blocked()
+      nursery.cancel_scope.cancel()
+
+  trio.run(main)
+
+
+def _slow_stream():
+  stream = BNStream('')
+
+  async def callback(transaction, unsubscribe):
+    time.sleep(0.002)
+
+  stream.subscribe_address(ADDRESS, callback)
+  return stream
+
+
+class TestProfiler(unittest.TestCase):
+  def test_stages_and_callbacks_are_timed(self):
+    stream = _slow_stream()
+    stream.profiler.start(window=None)
+    _run_messages(stream, 5)
+    report = stream.profiler.stop()
+
+    stages = report['stages']
+    for stage in ('poll_messages;decode', PREFIX, f'{PREFIX};status', f'{PREFIX};flatten'):
+      self.assertEqual(stages[stage]['count'], 5, stage)
+    callback = report['callbacks'][ADDRESS]
+    self.assertEqual(callback['count'], 5)
+    self.assertGreaterEqual(callback['total'], 0.01)
+    # Callback time is attributed to the callback, not to the handler itself
+    self.assertLess(stages[PREFIX]['self'], callback['total'])
+
+  def test_disabled_profiler_records_nothing(self):
+    stream = _slow_stream()
+    _run_messages(stream, 3)
+    self.assertEqual(stream.profiler.report()['stages'], {})
+
+  def test_report_is_written_after_window(self):
+    with tempfile.TemporaryDirectory() as directory:
+      path = os.path.join(directory, 'profile.txt')
+      stream = _slow_stream()
+      stream.profiler.start(window=0.02, path=path)
+      _run_messages(stream, 50)
+
+      self.assertFalse(stream.profiler.enabled)
+      with open(path) as profile_file:
+        lines = profile_file.read().splitlines()
+      stacks = dict(line.rsplit(' ', 1) for line in lines)
+      self.assertIn(f'{PREFIX};callback;{ADDRESS}', stacks)
+      self.assertTrue(all(value.isdigit() for value in stacks.values()))
+
+  def test_report_is_written_off_the_event_loop(self):
+    profiler = Profiler()
+    writers = []
+    profiler._write = lambda output: writers.append(threading.get_ident())
+
+    async def main():
+      profiler.start(window=0)
+      profiler.record('message_dispatcher;send', 0.001)
+      # Later stages of the same message do not write the report again
+      profiler.record('message_dispatcher;send', 0.001)
+      self.assertFalse(profiler.enabled)
+      self.assertEqual(writers, [])
+
+    trio.run(main)
+    self.assertEqual(len(writers), 1)
+    self.assertNotEqual(writers[0], threading.get_ident())
+    self.assertEqual(profiler.last_report['stages']['message_dispatcher;send']['count'], 1)
+
+  @unittest.skipUnless(hasattr(signal, 'SIGUSR1'), 'SIGUSR1 is not available')
+  def test_signal_toggles_profiling(self):
+    profiler = Profiler()
+    previous = signal.getsignal(signal.SIGUSR1)
+    self.addCleanup(signal.signal, signal.SIGUSR1, previous)
+    with tempfile.TemporaryDirectory() as directory:
+      profiler.path = os.path.join(directory, 'profile.json')
+      profiler.report_format = 'json'
+      profiler.install_signal_handler()
+
+      os.kill(os.getpid(), signal.SIGUSR1)
+      self.assertTrue(profiler.enabled)
+      profiler.record('message_dispatcher;send', 0.001)
+      os.kill(os.getpid(), signal.SIGUSR1)
+      self.assertFalse(profiler.enabled)
+      with open(profiler.path) as profile_file:
+        report = json.load(profile_file)
+    self.assertEqual(report['stages']['message_dispatcher;send']['count'], 1)
+
+  def test_default_signal_requires_sigusr1(self):
+    with mock.patch('blocknative.profiling.signal', types.SimpleNamespace(signal=signal.signal)):
+      with self.assertRaises(ValueError):
+        Profiler().install_signal_handler()
+
+  def test_rejects_unknown_format(self):
+    with self.assertRaises(ValueError):
+      Profiler().start(report_format='svg')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+from blocknative.ratelimit import AIMDRateController
+
+
+class TestAIMDRateController(unittest.TestCase):
+  def test_rate_increases_on_success(self):
+    controller = AIMDRateController(10.0)
+    for _ in range(10):
+      controller.on_success()
+    self.assertGreater(controller.rate, 10.0)
+    self.assertLess(controller.rate, 11.1)
+
+  def test_rate_never_exceeds_max(self):
+    controller = AIMDRateController(10.0, max_rate=10.5)
+    for _ in range(100):
+      controller.on_success()
+    self.assertEqual(controller.rate, 10.5)
+
+  def test_rate_halves_on_rate_limit(self):
+    controller = AIMDRateController(40.0)
+    controller.on_rate_limit()
+    self.assertEqual(controller.rate, 20.0)
+    self.assertEqual(controller.interval, 1 / 20.0)
+    self.assertEqual(controller.backoffs, 1)
+
+  def test_burst_of_rate_limits_backs_off_once(self):
+    controller = AIMDRateController(40.0, cooldown=60)
+    for _ in range(5):
+      controller.on_rate_limit()
+    self.assertEqual(controller.rate, 20.0)
+    self.assertEqual(controller.backoffs, 1)
+
+  def test_rate_never_drops_below_min(self):
+    controller = AIMDRateController(4.0, min_rate=3.0, cooldown=0)
+    controller.on_rate_limit()
+    controller.on_rate_limit()
+    self.assertEqual(controller.rate, 3.0)
+
+
+if __name__ == '__main__':
+  unittest.main()
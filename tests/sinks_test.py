@@ -0,0 +1,75 @@
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+import trio
+from blocknative.sinks import SQLiteSink
+from blocknative.stream import Stream as BNStream
+from stream_test import example_transaction
+
+
+class TestSQLiteSink(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.TemporaryDirectory()
+    self.path = os.path.join(self.directory.name, 'events.db')
+    self.transaction = BNStream('')._flatten_event_to_transaction(json.loads(example_transaction))
+
+  def tearDown(self):
+    self.directory.cleanup()
+
+  def _write(self, sink, count):
+    async def write():
+      for _ in range(count):
+        await sink(self.transaction, None)
+    trio.run(write)
+
+  def test_rows_are_written_in_batches(self):
+    with SQLiteSink(self.path, batch_size=100, max_pending=50) as sink:
+      self._write(sink, 1000)
+    self.assertEqual(sink.rows_written, 1000)
+    self.assertLess(sink.flushes, 1000)
+
+    connection = sqlite3.connect(self.path)
+    self.assertEqual(connection.execute('SELECT COUNT(*) FROM transactions').fetchone(), (1000,))
+    self.assertEqual(connection.execute('PRAGMA journal_mode').fetchone(), ('wal',))
+    row = connection.execute('SELECT "hash", "blockNumber", "contractCall" FROM transactions').fetchone()
+    self.assertEqual(row[0], self.transaction['hash'])
+    self.assertEqual(row[1], 13602467)
+    self.assertEqual(json.loads(row[2]), self.transaction['contractCall'])
+
+  def test_column_projection(self):
+    with SQLiteSink(self.path, table='hashes', columns=['hash', 'status']) as sink:
+      self._write(sink, 3)
+    connection = sqlite3.connect(self.path)
+    rows = connection.execute('SELECT * FROM hashes').fetchall()
+    self.assertEqual(rows, [(self.transaction['hash'], 'confirmed')] * 3)
+
+  def test_rows_are_flushed_after_interval(self):
+    sink = SQLiteSink(self.path, flush_interval=0.01)
+    self._write(sink, 5)
+    deadline = time.monotonic() + 5
+    while sink.rows_written < 5 and time.monotonic() < deadline:
+      time.sleep(0.01)
+    self.assertEqual(sink.rows_written, 5)
+    sink.close()
+
+  def test_write_error_is_raised_instead_of_blocking(self):
+    SQLiteSink(self.path, columns=['hash']).close()
+    sink = SQLiteSink(self.path, columns=['hash', 'status'], batch_size=1, max_pending=1)
+
+    async def write():
+      with trio.fail_after(5):
+        for _ in range(100):
+          await sink(self.transaction, None)
+
+    with self.assertRaises(sqlite3.OperationalError):
+      trio.run(write)
+    with self.assertRaises(sqlite3.OperationalError):
+      sink.close()
+    self.assertEqual(sink.rows_written, 0)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,84 @@
+import json
+import os
+import tempfile
+import unittest
+from blocknative.snapshot import PreparedMessage
+from blocknative.stream import Stream as BNStream, BatchPolicy
+from blocknative.utils import SubscriptionType
+from abi_test import ERC20_ABI
+
+SUBSCRIPTION_COUNT = 100
+
+
+async def _noop_callback(*args):
+  pass
+
+
+def _without_timestamp(message):
+  message = json.loads(message)
+  del message['timeStamp']
+  return message
+
+
+class TestSnapshot(unittest.TestCase):
+  def setUp(self):
+    directory = tempfile.TemporaryDirectory()
+    self.addCleanup(directory.cleanup)
+    self.path = os.path.join(directory.name, 'subscriptions.json')
+
+  def test_round_trip(self):
+    stream = BNStream('abc123')
+    stream.subscribe_address('0xabc', _noop_callback, [{'status': 'pending'}], ERC20_ABI)
+    stream.subscribe_address('0xdef', _noop_callback)
+    stream.subscribe_txn('0x123', _noop_callback, status='pending')
+    stream.save_snapshot(self.path)
+
+    restored = BNStream('abc123')
+    batch = BatchPolicy(max_items=10)
+    self.assertEqual(restored.load_snapshot(self.path, _noop_callback, batch), 3)
+
+    registry = restored._subscription_registry
+    self.assertEqual(set(registry), {'0xabc', '0xdef', '0x123'})
+    self.assertEqual(registry['0xabc'].data['filters'], [{'status': 'pending'}])
+    self.assertIs(registry['0xabc'].data['abi'], stream._subscription_registry['0xabc'].data['abi'])
+    self.assertIs(registry['0xabc'].batch, batch)
+    self.assertEqual(registry['0x123'].sub_type, SubscriptionType.TRANSACTION)
+    self.assertEqual(registry['0x123'].data, 'pending')
+    self.assertEqual(restored.subscription_counts.addresses, 2)
+    self.assertEqual(restored.subscription_counts.transactions, 1)
+
+  def test_prepared_message_matches_config_message(self):
+    stream = BNStream('abc123')
+    stream.subscribe_address('0xabc', _noop_callback, [{'status': 'pending'}], ERC20_ABI)
+    stream.save_snapshot(self.path)
+    restored = BNStream('abc123')
+    restored.load_snapshot(self.path, _noop_callback)
+
+    payload = restored._subscription_registry['0xabc'].payload
+    self.assertIsInstance(payload, PreparedMessage)
+    stream._send_config_message('0xabc', True, [{'status': 'pending'}], ERC20_ABI)
+    expected = stream._message_queue.get_nowait()
+    self.assertEqual(_without_timestamp(payload.stamp()), _without_timestamp(expected))
+    self.assertIn('timeStamp', json.loads(payload.stamp()))
+
+  def test_rejects_snapshot_of_other_network(self):
+    BNStream('abc123').save_snapshot(self.path)
+    with self.assertRaises(ValueError):
+      BNStream('abc123', network_id=5).load_snapshot(self.path, _noop_callback)
+
+  def test_bulk_load_restores_every_subscription(self):
+    stream = BNStream('abc123')
+    for i in range(SUBSCRIPTION_COUNT):
+      stream.subscribe_address(f'0x{i:040x}', _noop_callback, [{'status': 'pending'}], ERC20_ABI)
+    stream.save_snapshot(self.path)
+
+    restored = BNStream('abc123')
+    self.assertEqual(restored.load_snapshot(self.path, _noop_callback), SUBSCRIPTION_COUNT)
+    registry = restored._subscription_registry
+    self.assertEqual(list(registry), list(stream._subscription_registry))
+    self.assertTrue(all(isinstance(subscription.payload, PreparedMessage) for subscription in registry.values()))
+    self.assertEqual(restored.subscription_counts.addresses, SUBSCRIPTION_COUNT)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,6 +1,10 @@
 import unittest
 import json
-from blocknative.stream import Stream as BNStream
+from unittest import mock
+import trio
+import trio.testing
+from blocknative.snapshot import PreparedMessage
+from blocknative.stream import Stream as BNStream, BatchPolicy
 
 example_transaction = """
 {
@@ -125,5 +129,291 @@ class TestBlocknativeEventProperlyPackaged(unittest.TestCase):
         self.assertFalse(k in flattened, "Did not expect: "+k)
 
 
+class TestRateLimitedMessageIsRequeued(unittest.TestCase):
+  rate_limit_payload = {
+    'version': 0, 'serverVersion': '0.122.2', 'timeStamp': '2021-11-02T18:06:57.295Z', 'connectionId': 'XX-XX-XX-XX', 'status': 'error', 'event': {'timeStamp': '2021-11-02T18:06:51.655854', 'dappId': '', 'version': '1', 'blockchain': {'system': 'ethereum', 'network': 'main'}, 'categoryCode': 'initialize', 'eventCode': 'checkDappId'}, 'reason': 'ratelimit'
+  }
+
+  def test_rate_limit_backs_off_and_requeues(self):
+    stream = BNStream('')
+    rate = stream._send_rate.rate
+    trio.run(stream._message_handler, self.rate_limit_payload)
+    self.assertTrue(stream.valid_session)
+    self.assertEqual(stream._send_rate.rate, rate / 2)
+    self.assertEqual(list(stream._retry_queue), [self.rate_limit_payload['event']])
+
+  def test_idle_dispatcher_sends_retry(self):
+    stream = BNStream('')
+    sent = []
+
+    class _RecordingWebSocket:
+      async def send_message(self, message):
+        sent.append(json.loads(message))
+
+    stream._ws = _RecordingWebSocket()
+
+    async def main():
+      stream._attach_loop()
+      async with trio.open_nursery() as nursery:
+        nursery.start_soon(stream._message_dispatcher)
+        await trio.testing.wait_all_tasks_blocked()
+        await stream._message_handler(self.rate_limit_payload)
+        with trio.fail_after(1):
+          while not sent:
+            await trio.sleep(0.01)
+        nursery.cancel_scope.cancel()
+
+    trio.run(main)
+    self.assertEqual(sent, [self.rate_limit_payload['event']])
+    self.assertFalse(stream._retry_queue)
+
+
+class TestReconnect(unittest.TestCase):
+  def test_stale_messages_are_discarded(self):
+    stream = BNStream('')
+    stream._ws = _ConnectedWebSocket()
+
+    async def callback(txn, unsubscribe):
+      pass
+
+    stream.subscribe_address('0x7a250d5630b4cf539739df2c5dacb4c659f2488d', callback)
+    stream._retry_queue.append({'categoryCode': 'initialize', 'eventCode': 'checkDappId'})
+    stream._queue_session_messages()
+
+    self.assertFalse(stream._retry_queue)
+    messages = []
+    while not stream._message_queue.empty():
+      message = stream._message_queue.get_nowait()
+      if isinstance(message, PreparedMessage):
+        message = json.loads(message.stamp())
+      messages.append(message)
+    self.assertEqual(len(messages), 2)
+    self.assertEqual(messages[0]['eventCode'], 'checkDappId')
+    self.assertEqual(messages[1]['config']['scope'], '0x7a250d5630b4cf539739df2c5dacb4c659f2488d')
+
+
+class TestTransactionSubscriptionExpiry(unittest.TestCase):
+  def test_terminal_status_retires_subscription(self):
+    stream = BNStream('')
+    received = []
+
+    async def callback(txn):
+      received.append(txn['status'])
+
+    event = json.loads(example_transaction)
+    event['categoryCode'] = 'activeTransaction'
+    tx_hash = event['transaction']['hash']
+    stream.subscribe_txn(tx_hash, callback)
+    self.assertEqual(stream.subscription_counts.transactions, 1)
+
+    trio.run(stream._message_handler, {'status': 'ok', 'event': event})
+    trio.run(stream._message_handler, {'status': 'ok', 'event': event})
+    self.assertEqual(received, ['confirmed'])
+    self.assertNotIn(tx_hash, stream._subscription_registry)
+    self.assertEqual(stream.subscription_counts.transactions, 0)
+    self.assertEqual(stream.subscription_counts.retired, 1)
+
+  def test_ttl_expires_subscriptions(self):
+    stream = BNStream('')
+
+    async def callback(txn):
+      pass
+
+    stream.subscribe_txn('0x1', callback, ttl=0)
+    stream.subscribe_txn('0x2', callback, ttl=0)
+    stream.subscribe_txn('0x3', callback, ttl=3600)
+    # Replacing a subscription invalidates the TTL of the previous one
+    stream.subscribe_txn('0x2', callback)
+    stream._expire_subscriptions()
+
+    self.assertEqual(list(stream._subscription_registry), ['0x3', '0x2'])
+    self.assertEqual(stream.subscription_counts.transactions, 2)
+    self.assertEqual(stream.subscription_counts.expired, 1)
+    self.assertEqual(len(stream._expiry_heap), 1)
+
+  def test_expired_unwatches_are_queued_together(self):
+    stream = BNStream('')
+
+    async def callback(txn):
+      pass
+
+    for i in range(50):
+      stream.subscribe_txn(f'0x{i}', callback, ttl=0)
+    stream._ws = _ConnectedWebSocket()
+    with mock.patch.object(stream, '_wake_dispatcher') as wake:
+      stream._expire_subscriptions()
+
+    wake.assert_called_once()
+    unwatched = []
+    while not stream._message_queue.empty():
+      message = stream._message_queue.get_nowait()
+      self.assertEqual(message['eventCode'], 'unwatch')
+      unwatched.append(message['transaction']['hash'])
+    self.assertEqual(unwatched, [f'0x{i}' for i in range(50)])
+
+
+class _BufferedWebSocket:
+  """Websocket whose received messages are all buffered already."""
+
+  def __init__(self, messages):
+    self._send_channel, self._recv_channel = trio.open_memory_channel(len(messages))
+    for message in messages:
+      self._send_channel.send_nowait(message)
+
+  async def get_message(self):
+    return await self._recv_channel.receive()
+
+
+class TestBatchedDelivery(unittest.TestCase):
+  address = '0x7a250d5630b4cf539739df2c5dacb4c659f2488d'
+
+  def _subscribe(self, stream, policy):
+    batches = []
+
+    async def callback(transactions, unsubscribe):
+      batches.append([txn['nonce'] for txn in transactions])
+
+    stream.subscribe_address(self.address, callback, batch=policy)
+    return batches
+
+  def _message(self, nonce):
+    event = json.loads(example_transaction)
+    event['transaction']['nonce'] = nonce
+    return {'status': 'ok', 'event': event}
+
+  def test_full_batch_is_delivered(self):
+    stream = BNStream('')
+    batches = self._subscribe(stream, BatchPolicy(max_items=3))
+
+    async def main():
+      for nonce in range(5):
+        await stream._message_handler(self._message(nonce))
+      self.assertEqual(batches, [[0, 1, 2]])
+      await stream._flush_batches()
+
+    trio.run(main)
+    self.assertEqual(batches, [[0, 1, 2], [3, 4]])
+
+  def test_buffered_messages_are_batched_together(self):
+    stream = BNStream('')
+    batches = self._subscribe(stream, BatchPolicy(max_items=100, max_latency_ms=60_000))
+    stream._ws = _BufferedWebSocket([json.dumps(self._message(nonce)) for nonce in range(5)])
+
+    async def main():
+      async with trio.open_nursery() as nursery:
+        nursery.start_soon(stream._poll_messages)
+        await trio.testing.wait_all_tasks_blocked()
+        nursery.cancel_scope.cancel()
+
+    trio.run(main)
+    self.assertEqual(batches, [[0, 1, 2, 3, 4]])
+
+  def test_unsubscribe_discards_pending_batch(self):
+    stream = BNStream('')
+    batches = self._subscribe(stream, BatchPolicy())
+
+    async def main():
+      await stream._message_handler(self._message(0))
+      stream.unsubscribe(self.address)
+      await stream._flush_batches()
+
+    trio.run(main)
+    self.assertEqual(batches, [])
+    self.assertEqual(stream._pending_batches, {})
+
+
+
+class _ConnectedWebSocket:
+  closed = False
+
+
+class TestSubscriptionUpdates(unittest.TestCase):
+  address = '0x7a250d5630b4cf539739df2c5dacb4c659f2488d'
+
+  def _connected_stream(self):
+    stream = BNStream('')
+    stream._ws = _ConnectedWebSocket()
+    return stream
+
+  def _sent(self, stream):
+    messages = []
+    while not stream._message_queue.empty():
+      message = stream._message_queue.get_nowait()
+      if isinstance(message, PreparedMessage):
+        message = message.stamp()
+      messages.append(json.loads(message) if isinstance(message, str) else message)
+    return messages
+
+  def _poll(self, stream, messages):
+    stream._ws = _BufferedWebSocket(messages)
+
+    async def main():
+      async with trio.open_nursery() as nursery:
+        nursery.start_soon(stream._poll_messages)
+        await trio.testing.wait_all_tasks_blocked()
+        nursery.cancel_scope.cancel()
+
+    trio.run(main)
+
+  def test_update_sends_single_config(self):
+    stream = self._connected_stream()
+
+    async def callback(txn, unsubscribe):
+      pass
+
+    stream.subscribe_address(self.address, callback, filters=[{'status': 'pending'}])
+    self._sent(stream)
+    stream.update_subscription('0x7A250D5630B4cF539739dF2C5dAcb4c659F2488D', filters=[{'status': 'confirmed'}])
+
+    messages = self._sent(stream)
+    self.assertEqual(len(messages), 1)
+    self.assertEqual(messages[0]['categoryCode'], 'configs')
+    self.assertEqual(messages[0]['config']['filters'], [{'status': 'confirmed'}])
+    subscription = stream._subscription_registry[self.address]
+    self.assertIs(subscription.callback, callback)
+    self.assertEqual(subscription.data['filters'], [{'status': 'confirmed'}])
+    self.assertEqual(stream.subscription_counts.addresses, 1)
+
+  def test_update_unknown_address_raises(self):
+    with self.assertRaises(KeyError):
+      BNStream('').update_subscription(self.address, filters=None)
+
+  def test_unsubscribe_sends_unwatch(self):
+    stream = self._connected_stream()
+    stream.subscribe_address(self.address, None)
+    stream.subscribe_txn('0x123', None)
+    self._sent(stream)
+
+    stream.unsubscribe_many([self.address, '0x123', '0xnotsubscribed'])
+
+    messages = self._sent(stream)
+    self.assertEqual(
+      [(m['categoryCode'], m['eventCode']) for m in messages],
+      [('accountAddress', 'unwatch'), ('activeTransaction', 'unwatch')],
+    )
+    self.assertEqual(messages[0]['account'], {'address': self.address})
+    self.assertEqual(messages[1]['transaction'], {'hash': '0x123'})
+    self.assertEqual(stream._subscription_registry, {})
+
+  def test_late_events_of_removed_address_are_not_decoded(self):
+    stream = BNStream('')
+    delivered = []
+
+    async def callback(txn, unsubscribe):
+      delivered.append(txn['hash'])
+
+    stream.subscribe_address(self.address, callback)
+    stream.unsubscribe(self.address)
+    message = json.dumps({'status': 'ok', 'event': json.loads(example_transaction)})
+    with mock.patch.object(json, 'loads', wraps=json.loads) as loads:
+      self._poll(stream, [message])
+    loads.assert_not_called()
+
+    # Subscribing again lets events through
+    stream._ws = None
+    stream.subscribe_address(self.address, callback)
+    self._poll(stream, [message])
+    self.assertEqual(len(delivered), 1)
+
 if __name__ == '__main__':
-  unittest.main()
\ No newline at end of file
+  unittest.main()
@@ -0,0 +1,167 @@
+import inspect
+import math
+import os
+import ssl
+import unittest
+import trio
+from trio_websocket import serve_websocket
+from blocknative.connection import Connector, open_websocket
+from blocknative.stream import Stream as BNStream
+
+CERT = os.path.join(os.path.dirname(__file__), 'localhost.pem')
+KEY = os.path.join(os.path.dirname(__file__), 'localhost.key')
+
+
+async def _hello(request):
+  ws = await request.accept()
+  await ws.send_message('hello')
+  try:
+    await ws.get_message()
+  except Exception:
+    pass
+
+
+def _server_context():
+  context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+  context.load_cert_chain(CERT, KEY)
+  return context
+
+
+async def _with_server(test):
+  async with trio.open_nursery() as nursery:
+    server = await nursery.start(serve_websocket, _hello, '127.0.0.1', 0, _server_context())
+    connector = Connector(ssl.create_default_context(cafile=CERT), prewarm=test.prewarm)
+    try:
+      await test(server.port, connector)
+    finally:
+      await connector.aclose()
+    nursery.cancel_scope.cancel()
+
+
+async def _connect(port, connector):
+  async with open_websocket(f'wss://localhost:{port}', connector=connector) as ws:
+    return await ws.get_message()
+
+
+def _addrinfo(port):
+  return trio.socket.getaddrinfo('127.0.0.1', port, type=trio.socket.SOCK_STREAM)
+
+
+class TestConnector(unittest.TestCase):
+  def run_test(self, test, prewarm=False):
+    test.prewarm = prewarm
+    trio.run(_with_server, test)
+
+  def test_reconnect_resumes_tls_session_and_reuses_dns(self):
+    async def test(port, connector):
+      self.assertEqual(await _connect(port, connector), 'hello')
+      first = connector.timings
+      self.assertFalse(first.session_reused)
+      self.assertFalse(first.dns_cached)
+
+      self.assertEqual(await _connect(port, connector), 'hello')
+      second = connector.timings
+      self.assertTrue(second.session_reused)
+      self.assertTrue(second.dns_cached)
+      self.assertEqual(second.dns, 0)
+      self.assertGreater(second.total, 0)
+
+    self.run_test(test)
+
+  def test_falls_back_to_next_address(self):
+    async def test(port, connector):
+      closed = trio.socket.socket()
+      await closed.bind(('127.0.0.1', 0))
+      closed_port = closed.getsockname()[1]
+      closed.close()
+      addresses = await _addrinfo(closed_port) + await _addrinfo(port)
+      connector._addresses[('localhost', port)] = (math.inf, addresses)
+
+      self.assertEqual(await _connect(port, connector), 'hello')
+      # The working address is tried first from now on
+      self.assertEqual(connector._addresses[('localhost', port)][1][0][4][1], port)
+
+    self.run_test(test)
+
+  def test_prewarmed_standby_is_used_on_reconnect(self):
+    async def test(port, connector):
+      async with open_websocket(f'wss://localhost:{port}', connector=connector) as ws:
+        await ws.get_message()
+        self.assertFalse(connector.timings.standby)
+        with trio.fail_after(5):
+          while not connector._standby:
+            await trio.sleep(0.01)
+
+      self.assertEqual(await _connect(port, connector), 'hello')
+      self.assertTrue(connector.timings.standby)
+      self.assertEqual(connector.timings.tls, 0)
+
+    self.run_test(test, prewarm=True)
+
+  def test_single_standby_task_per_host(self):
+    async def test(port, connector):
+      url = f'wss://localhost:{port}'
+      async with open_websocket(url, connector=connector) as first:
+        async with open_websocket(url, connector=connector) as second:
+          await first.get_message()
+          await second.get_message()
+          with trio.fail_after(5):
+            while not connector._standby:
+              await trio.sleep(0.01)
+          self.assertEqual(len(connector._standby_tasks), 1)
+          standby = connector._standby[('localhost', port, True)]
+
+          # A reconnect stops the task of the previous connection before starting its own
+          connector.stop_standby(url)
+          async with open_websocket(url, connector=connector) as third:
+            self.assertEqual(await third.get_message(), 'hello')
+            self.assertTrue(connector.timings.standby)
+            with trio.fail_after(5):
+              while not connector._standby:
+                await trio.sleep(0.01)
+            self.assertEqual(len(connector._standby_tasks), 1)
+            self.assertIsNot(connector._standby[('localhost', port, True)], standby)
+
+      await connector.aclose()
+      self.assertEqual(connector._standby_tasks, {})
+      self.assertEqual(connector._standby, {})
+
+    self.run_test(test, prewarm=True)
+
+  def test_connect_closes_connector(self):
+    async def test(port, connector):
+      stream = BNStream('', connector=connector)
+
+      async def handle_connection():
+        with trio.fail_after(5):
+          while not connector._standby:
+            await trio.sleep(0.01)
+
+      stream._handle_connection = handle_connection
+      await stream._run(f'wss://localhost:{port}')
+      self.assertEqual(connector._standby_tasks, {})
+      self.assertEqual(connector._standby, {})
+
+    self.run_test(test, prewarm=True)
+
+  def test_reconnects_in_a_loop(self):
+    async def test(port, connector):
+      stream = BNStream('', connector=connector)
+      depths = []
+
+      async def handle_connection():
+        depths.append(len(inspect.stack()))
+        if len(depths) < 3:
+          raise trio.TooSlowError
+
+      stream._handle_connection = handle_connection
+      with trio.fail_after(5):
+        await stream._connect(f'wss://localhost:{port}')
+      self.assertEqual(len(depths), 3)
+      self.assertEqual(len(set(depths)), 1)
+
+    self.run_test(test)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,72 @@
+import logging
+import os
+import subprocess
+import sys
+import unittest
+from blocknative.tracing import RateLimitedLog, TrafficTrace
+
+ROOT = os.path.join(os.path.dirname(__file__), os.pardir)
+
+
+class _Records(logging.Handler):
+  def __init__(self):
+    super().__init__()
+    self.messages = []
+
+  def emit(self, record):
+    self.messages.append(record.getMessage())
+
+
+def _logger(name, level):
+  logger = logging.getLogger(f'blocknative.test.{name}')
+  logger.propagate = False
+  logger.setLevel(level)
+  records = _Records()
+  logger.addHandler(records)
+  return logger, records
+
+
+class TestTracing(unittest.TestCase):
+  def test_rate_limited_log_counts_suppressed_messages(self):
+    logger, records = _logger('ratelimit', logging.WARNING)
+    log = RateLimitedLog(logger, interval=60)
+    for rate in range(3):
+      log.log(logging.WARNING, 'Rate limited, rate %d', rate)
+    self.assertEqual(records.messages, ['Rate limited, rate 0'])
+
+    log._next_at = 0
+    log.log(logging.WARNING, 'Rate limited, rate %d', 3)
+    self.assertEqual(records.messages[1], 'Rate limited, rate 3 (2 similar messages suppressed)')
+
+  def test_trace_samples_messages_at_debug_level(self):
+    logger, records = _logger('trace', logging.DEBUG)
+    trace = TrafficTrace(logger, sample_rate=10)
+    for i in range(25):
+      trace.sent(f'message {i}')
+    self.assertEqual(
+      records.messages,
+      ['Sent message #1: message 0', 'Sent message #11: message 10', 'Sent message #21: message 20'],
+    )
+
+  def test_trace_is_silent_above_debug_level(self):
+    logger, records = _logger('quiet', logging.INFO)
+    trace = TrafficTrace(logger, sample_rate=1)
+    trace.sent('message')
+    trace.received('message')
+    self.assertEqual(records.messages, [])
+    self.assertEqual(trace._sent, 0)
+
+  def test_import_leaves_logging_and_websocket_modules_alone(self):
+    script = (
+      'import logging, sys\n'
+      'import blocknative.stream\n'
+      'print(len(logging.getLogger().handlers), "trio_websocket" in sys.modules, "wsproto" in sys.modules)\n'
+    )
+    output = subprocess.run(
+      [sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout.split()
+    self.assertEqual(output, ['0', 'False', 'False'])
+
+
+if __name__ == '__main__':
+  unittest.main()